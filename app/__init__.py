@@ -1,14 +1,64 @@
+import os
+from threading import BoundedSemaphore
+
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_httpauth import HTTPBasicAuth
 
 from config import Config
+from app.model.cache import CredentialCache, TaskListCache, LRUCache, RedisCache, RecentWrites
+from app.model.storage import configure_storage, configure_engine, create_replica_session
+from app.model.events import ChangeNotifier
+from app.model.jobs import JobExecutor
+from app.model.limits import RateLimiter, MemoryBucketStore, RedisBucketStore, SingleFlight, parse_limits
 app = Flask(__name__, template_folder='view/templates')
 app.config.from_object(Config)
+configure_storage(app)
 db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+configure_engine(db, app)
+migrate = None  # Flask-Migrate с alembic нужен только командам flask db, создается в create_app
+replica_session = create_replica_session(app)
 auth = HTTPBasicAuth()
+credential_cache = CredentialCache(app.config['SECRET_KEY'], app.config['AUTH_CACHE_SIZE'],
+                                   app.config['AUTH_CACHE_TTL'])
+tasks_cache = TaskListCache(RedisCache(app.config['TASKS_CACHE_URL'], app.config['TASKS_CACHE_TTL'])
+                            if app.config['TASKS_CACHE_URL']
+                            else LRUCache(app.config['TASKS_CACHE_SIZE'], app.config['TASKS_CACHE_BYTES']))
+# Окна read-your-writes хранятся там же, где кэш списков задач, чтобы их видели все воркеры
+recent_writes = RecentWrites(RedisCache(app.config['TASKS_CACHE_URL'], int(app.config['REPLICA_READ_AFTER_WRITE']) + 1)
+                             if app.config['TASKS_CACHE_URL'] else LRUCache(10000),
+                             app.config['REPLICA_READ_AFTER_WRITE'])
+change_notifier = ChangeNotifier()
+change_waiters = BoundedSemaphore(app.config['CHANGES_MAX_WAITERS'])
+rate_limiter = RateLimiter(RedisBucketStore(app.config['RATE_LIMIT_URL']) if app.config['RATE_LIMIT_URL']
+                           else MemoryBucketStore(), parse_limits(app.config['RATE_LIMITS']))
+single_flight = SingleFlight()
+job_executor = JobExecutor(app.config['JOB_WORKERS'])
 
+from app.controller import metrics  # Регистрируется до routes, чтобы учитывать все обработчики after_request
 from app.controller import routes
+from app.controller import scheduler
 from app.model import models
+
+
+def create_app() -> Flask:
+    """Returns the app ready to serve requests or to run flask commands
+
+    Flask-Migrate and alembic are loaded only when the app is started by the flask command line,
+    a web worker does not import them. The extensions are module-level objects, so there is
+    one app per process and repeated calls return the same app. The module calls it on import,
+    so commands work with FLASK_APP=app too.
+
+    :return: object Flask
+
+    """
+
+    global migrate
+    if migrate is None and os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        from flask_migrate import Migrate
+        migrate = Migrate(app, db, render_as_batch=True)
+    return app
+
+
+# flask с FLASK_APP=app берет объект app напрямую, не вызывая create_app
+create_app()
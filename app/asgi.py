@@ -0,0 +1,228 @@
+"""ASGI entry point of the app List of tasks
+
+Serves the same routes, JSON responses and error handlers as the WSGI app, e.g.:
+
+    uvicorn app.asgi:application
+
+Connections are handled by the event loop, a request is passed to the Flask app in a thread
+of a pool of ASGI_THREADS threads, so idle and slow clients do not hold a worker process.
+At most ASGI_QUEUE requests wait for a free thread, the next ones get 503 at once.
+
+A waiting /tasks/changes request does not hold a thread: the route answers at once and asks
+to be called again (see LONG_POLL), the wait for a notification of the process or the next
+poll of the database (CHANGES_POLL_INTERVAL) happens in the event loop. So one process keeps
+thousands of long polls, each one takes a thread only for a query.
+"""
+import asyncio
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from app import create_app, change_notifier
+from app.model.events import LONG_POLL, LONG_POLL_RETRY
+
+BODY_IN_MEMORY = 1024 * 1024  # Тело запроса больше 1 Мб сбрасывается во временный файл
+
+
+class WSGIApplication(object):
+    """ASGI application that runs a WSGI application in a thread pool"""
+
+    def __init__(self, wsgi_app, max_workers: int, max_queue: int, notifier=None):
+        """
+        :param wsgi_app: WSGI application, e.g. the Flask app
+        :param max_workers: number of threads running requests
+        :param max_queue: number of requests waiting for a free thread, the next ones are rejected with 503
+        :param notifier: ChangeNotifier waking up long polls, without it they wait for the next poll
+
+        """
+
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='asgi')
+        self.max_pending = max_workers + max_queue
+        self.pending = 0  # Запросы в потоках и в очереди, изменяется только в цикле событий
+        self.notifier = notifier
+        self.long_polls = 0  # Ожидающие запросы, не занимающие потоков
+
+    async def __call__(self, scope: dict, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError(f'unsupported ASGI scope type {scope["type"]}')
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope: dict, receive, send):
+        body = SpooledTemporaryFile(max_size=BODY_IN_MEMORY)
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return
+            body.write(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+        loop = asyncio.get_running_loop()
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        def send_message(message: dict):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        watcher = loop.create_task(watch_disconnect())
+        long_poll, retry, deadline = {}, False, None
+        try:
+            while True:
+                if self.pending >= self.max_pending:
+                    await self.unavailable(send)
+                    return
+                body.seek(0)
+                environ = self.environ(scope, body)
+                environ[LONG_POLL], environ[LONG_POLL_RETRY] = long_poll, retry
+                self.pending += 1
+                try:
+                    sent = await loop.run_in_executor(self.executor, self.run, environ, send_message)
+                finally:
+                    self.pending -= 1
+                if sent:
+                    return
+                # Изменений нет: ожидание в цикле событий до уведомления, опроса базы или конца wait
+                deadline = deadline or loop.time() + long_poll['wait']
+                self.long_polls += 1
+                try:
+                    await self.wait_changes(long_poll, deadline, disconnected)
+                finally:
+                    self.long_polls -= 1
+                if disconnected.is_set():
+                    return
+                long_poll, retry = ({} if loop.time() < deadline else None), True
+        finally:
+            watcher.cancel()
+            body.close()
+
+    async def wait_changes(self, long_poll: dict, deadline: float, disconnected: asyncio.Event):
+        """Waits for a notification about the user, the next poll of the database or a disconnect
+
+        :param long_poll: filled by the route: user_id, version of the notifier seen, interval of polls
+        :param deadline: end of the wait by the loop clock
+        :param disconnected: set when the client disconnects
+
+        """
+
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+
+        def wake_up():
+            loop.call_soon_threadsafe(changed.set)
+
+        if self.notifier is not None:
+            self.notifier.subscribe(long_poll['user_id'], wake_up)
+        waiters = [loop.create_task(changed.wait()), loop.create_task(disconnected.wait())]
+        try:
+            if self.notifier is not None and self.notifier.version(long_poll['user_id']) != long_poll['version']:
+                return  # Уведомление пришло между запросом к базе и подпиской
+            await asyncio.wait(waiters, timeout=max(0.0, min(deadline - loop.time(), long_poll['interval'])),
+                               return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+            if self.notifier is not None:
+                self.notifier.unsubscribe(long_poll['user_id'], wake_up)
+
+    @staticmethod
+    async def unavailable(send):
+        """Rejects a request when all threads are busy and the queue is full"""
+
+        body = json.dumps({'error': 'service unavailable', 'message': 'too many concurrent requests'}).encode()
+        await send({'type': 'http.response.start', 'status': 503,
+                    'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                                (b'retry-after', b'1')]})
+        await send({'type': 'http.response.body', 'body': body, 'more_body': False})
+
+    def run(self, environ: dict, send_message) -> bool:
+        """Calls the WSGI application and sends its response, runs in a thread of the pool
+
+        The whole response is iterated in one thread: Flask keeps the request context in
+        thread locals, a streamed response must not move between threads.
+
+        :return: False if the route asked to wait for changes, the response is dropped
+
+        """
+
+        response_start = {}
+
+        def start_response(status: str, headers: list, exc_info=None):
+            response_start['status'] = int(status.split(' ', 1)[0])
+            response_start['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                         for name, value in headers]
+
+        result = self.wsgi_app(environ, start_response)
+        if environ[LONG_POLL]:
+            if hasattr(result, 'close'):
+                result.close()
+            return False
+        started = False
+        try:
+            for chunk in result:
+                if not chunk:
+                    continue
+                if not started:
+                    send_message(dict(response_start, type='http.response.start'))
+                    started = True
+                send_message({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not started:
+                send_message(dict(response_start, type='http.response.start'))
+            send_message({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return True
+
+    @staticmethod
+    def environ(scope: dict, body) -> dict:
+        """Builds a WSGI environ (PEP 3333) from an ASGI http scope"""
+
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf8').decode('latin-1'),
+            'QUERY_STRING': scope['query_string'].decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.input_terminated': True,  # Тело уже прочитано целиком, в том числе без Content-Length
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+        for name, value in scope.get('headers', []):
+            name, value = name.decode('latin-1').upper().replace('-', '_'), value.decode('latin-1')
+            if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                name = 'HTTP_' + name
+            environ[name] = f'{environ[name]},{value}' if name in environ else value
+        return environ
+
+
+app = create_app()
+application = WSGIApplication(app, app.config['ASGI_THREADS'], app.config['ASGI_QUEUE'], change_notifier)
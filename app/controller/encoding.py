@@ -0,0 +1,98 @@
+"""Content negotiation of the task endpoints: MessagePack and compressed responses
+
+msgpack and brotli are optional, without them only JSON and gzip are offered.
+"""
+import gzip
+import zlib
+
+from flask import request
+
+from app import app
+import app.model.serializers as serializers
+import app.controller.metrics as metrics
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson') + MSGPACK_MIMETYPES
+
+
+def wants_msgpack() -> bool:
+    if msgpack is None:
+        return False
+    offered = ('application/json',) + MSGPACK_MIMETYPES
+    return request.accept_mimetypes.best_match(offered, default='application/json') in MSGPACK_MIMETYPES
+
+
+@metrics.timed('serialization')
+def data_response(data, status: int = 200) -> object:
+    """Response with the data encoded as MessagePack or JSON, as the client asked in Accept
+
+    :param data: dicts and lists made by to_dict or serializers.task_row_to_dict
+    :param status: HTTP status code
+    :return: object Response
+
+    """
+
+    if wants_msgpack():
+        response = app.response_class(msgpack.packb(data, use_bin_type=True), status=status,
+                                      mimetype='application/msgpack')
+    else:
+        response = app.response_class(serializers.dumps(data) + b'\n', status=status,
+                                      mimetype=app.config['JSONIFY_MIMETYPE'])
+    response.vary.add('Accept')
+    return response
+
+
+def accepted_encoding() -> str:
+    """Best compression supported by both sides: br, gzip or None"""
+
+    encodings = request.accept_encodings
+    if brotli is not None and encodings['br']:
+        return 'br'
+    elif encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(app.config['COMPRESS_LEVEL'], zlib.DEFLATED, 31)  # 31 - формат gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@app.after_request
+def compress(response):
+    """Compresses JSON and MessagePack responses of at least COMPRESS_MIN_SIZE bytes"""
+
+    if response.status_code != 200 or response.mimetype not in COMPRESSIBLE_MIMETYPES \
+            or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = accepted_encoding()
+    if encoding is None:
+        return response
+    if response.is_streamed:  # Потоковый ответ сжимается по частям, размер заранее неизвестен
+        if encoding != 'gzip':
+            return response
+        response.response = gzip_stream(response.response)
+    else:
+        data = response.get_data()
+        if len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+        if encoding == 'br':
+            response.set_data(brotli.compress(data, quality=app.config['COMPRESS_LEVEL']))
+        else:
+            response.set_data(gzip.compress(data, app.config['COMPRESS_LEVEL']))
+    response.headers['Content-Encoding'] = encoding
+    return response
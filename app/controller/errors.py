@@ -1,3 +1,5 @@
+import math
+
 from flask import make_response, jsonify
 from app import app, auth
 
@@ -38,6 +40,30 @@ def method_not_allowed(error: str = None) -> object:
     return make_response(jsonify(response), 405)
 
 
+@app.errorhandler(429)
+def too_many_requests(error: str = None, retry_after: float = None) -> object:
+    response = {'error': 'too many requests',
+                'message': ''}
+    if error is not None:
+        response['message'] = f'{error}'
+    response = make_response(jsonify(response), 429)
+    if retry_after is not None:
+        response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
+@app.errorhandler(503)
+def service_unavailable(error: str = None, retry_after: float = None) -> object:
+    response = {'error': 'service unavailable',
+                'message': ''}
+    if error is not None:
+        response['message'] = f'{error}'
+    response = make_response(jsonify(response), 503)
+    if retry_after is not None:
+        response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
 @app.errorhandler(500)
 def server_error(error: str = None) -> object:
     response = {'error': 'internal server error',
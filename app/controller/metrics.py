@@ -0,0 +1,188 @@
+"""Performance instrumentation of requests and the /metrics endpoint in Prometheus text format
+
+For every request the time is split between authentication, database queries and
+serialization, the stages do not overlap. Metrics are kept per process.
+"""
+import cProfile
+import os
+import random
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+from time import perf_counter, strftime
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import app, credential_cache, tasks_cache, single_flight
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram(object):
+    """Prometheus histogram with labels"""
+
+    def __init__(self, name: str, documentation: str, label_names: tuple, buckets: tuple = BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # labels -> [counts by bucket..., sum, count]
+        self._lock = Lock()
+
+    def observe(self, labels: tuple, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[bisect_left(self.buckets, value)] += 1  # Последняя корзина - +Inf
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                label_text = ','.join(f'{name}="{label}"' for name, label in zip(self.label_names, labels))
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), series):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                lines.append(f'{self.name}_sum{{{label_text}}} {series[-2]}')
+                lines.append(f'{self.name}_count{{{label_text}}} {series[-1]}')
+        return lines
+
+
+class Counter(object):
+    """Prometheus counter with labels"""
+
+    def __init__(self, name: str, documentation: str, label_names: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, labels: tuple, value: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                label_text = ','.join(f'{name}="{label}"' for name, label in zip(self.label_names, labels))
+                lines.append(f'{self.name}{{{label_text}}} {value}')
+        return lines
+
+
+request_duration = Histogram('list_tasks_request_duration_seconds', 'Time of request processing',
+                             ('endpoint', 'method', 'status'))
+stage_duration = Histogram('list_tasks_stage_duration_seconds',
+                           'Time spent in a stage of request processing: auth, db or serialization',
+                           ('endpoint', 'stage'))
+db_statements = Counter('list_tasks_db_statements_total', 'SQL statements executed by requests', ('endpoint',))
+
+STAGES = ('auth', 'db', 'serialization')
+
+
+def add_time(stage: str, seconds: float):
+    if has_request_context() and 'metrics' in g:
+        g.metrics[stage] += seconds
+
+
+@contextmanager
+def timer(stage: str, exclude: tuple = ()):
+    """Adds the time of the block to a stage of the current request
+
+    :param stage: name of the stage
+    :param exclude: stages measured inside the block, e.g. db, their time is not added twice
+
+    """
+
+    measured = has_request_context() and 'metrics' in g
+    nested = sum(g.metrics[name] for name in exclude) if measured else 0.0
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = perf_counter() - start
+        if measured:
+            elapsed -= sum(g.metrics[name] for name in exclude) - nested
+        add_time(stage, elapsed)
+
+
+def timed(stage: str, exclude: tuple = ()):
+    """Decorator adding the time of the function to a stage of the current request, see timer"""
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with timer(stage, exclude):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = perf_counter() - conn.info['query_start'].pop()
+    if has_request_context() and 'metrics' in g:
+        g.metrics['db'] += elapsed
+        g.metrics['db_statements'] += 1
+
+
+@app.before_request
+def start_request():
+    g.metrics = dict.fromkeys(STAGES, 0.0)
+    g.metrics['db_statements'] = 0
+    g.request_start = perf_counter()
+    g.profiler = None
+    if app.config['PROFILE_SLOW_REQUESTS'] and random.random() < app.config['PROFILE_SAMPLE_RATE']:
+        g.profiler = cProfile.Profile()
+        try:
+            g.profiler.enable()
+        except ValueError:  # Уже работает другой профилировщик
+            g.profiler = None
+
+
+@app.after_request
+def finish_request(response):
+    if 'request_start' not in g:
+        return response
+    elapsed = perf_counter() - g.request_start
+    endpoint = request.endpoint or 'unknown'
+    request_duration.observe((endpoint, request.method, str(response.status_code)), elapsed)
+    for stage in STAGES:
+        stage_duration.observe((endpoint, stage), g.metrics[stage])
+    db_statements.inc((endpoint,), g.metrics['db_statements'])
+    if g.profiler is not None:
+        g.profiler.disable()
+        if elapsed * 1000 >= app.config['PROFILE_SLOW_REQUESTS']:
+            os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+            g.profiler.dump_stats(os.path.join(app.config['PROFILE_DIR'],
+                                               f'{endpoint}-{strftime("%Y%m%d-%H%M%S")}-{int(elapsed * 1000)}ms.prof'))
+    return response
+
+
+def render() -> str:
+    """All metrics of the process in Prometheus text format"""
+
+    lines = request_duration.render() + stage_duration.render() + db_statements.render()
+    lines += ['# HELP list_tasks_cache_requests_total Lookups in the caches',
+              '# TYPE list_tasks_cache_requests_total counter']
+    for name, cache in (('credentials', credential_cache), ('tasks', tasks_cache)):
+        lines.append(f'list_tasks_cache_requests_total{{cache="{name}",result="hit"}} {cache.hits}')
+        lines.append(f'list_tasks_cache_requests_total{{cache="{name}",result="miss"}} {cache.misses}')
+    lines += ['# HELP list_tasks_coalesced_requests_total Requests served with the response of an identical '
+              'concurrent request',
+              '# TYPE list_tasks_coalesced_requests_total counter',
+              f'list_tasks_coalesced_requests_total {single_flight.shared}']
+    return '\n'.join(lines) + '\n'
@@ -1,59 +1,431 @@
-from flask import render_template, jsonify, make_response, request
+import math
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from functools import lru_cache, wraps
+from hashlib import sha1
+from time import monotonic
 
-from app import app, auth
-from app.controller.errors import unauthorized, server_error, not_found, bad_request
+from flask import render_template, jsonify, make_response, request, g, Response, stream_with_context, url_for
+
+from app import app, db, auth, credential_cache, tasks_cache, change_notifier, change_waiters, rate_limiter, single_flight
+from app.controller.errors import unauthorized, server_error, not_found, bad_request, too_many_requests, \
+    service_unavailable
+from app.model.events import LONG_POLL, LONG_POLL_RETRY
+from app.model.models import INTEGER_RANGE
 import app.model.services as service
+import app.model.serializers as serializers
+import app.controller.encoding as encoding
+import app.controller.metrics as metrics
+
+TASK_ID_MAX = INTEGER_RANGE[-1]  # Больший id в url - 404, а не ошибка SQLite
 
 
 @auth.verify_password
+@metrics.timed('auth', exclude=('db',))  # SQL проверки логина учитывается в db
 def verify_password(login, password):
+    if login and not password:  # Токен доступа передается вместо логина
+        user = service.check_token(login)
+        if user:
+            g.user = user
+            g.token_auth = True
+            return True
     user = service.check_login(login)
     if user:
-        if user.check_password(password):
+        if credential_cache.check(user.login, user.password_hash, password):
+            verified = True
+        else:
+            verified = user.check_password(password)
+            if verified:
+                credential_cache.add(user.login, user.password_hash, password)
+        if verified:
+            g.user = user
+            g.token_auth = False
             return True
         else:
             unauthorized('wrong password')
     unauthorized('unauthorized access')
 
 
+def task_filters() -> (dict, str):
+    """Parses pagination and filter parameters of the task list
+
+    :return: (filters, error): keyword arguments for service.get_task_rows and an error message or None
+
+    """
+
+    filters = {}
+    args = request.args
+    if 'limit' in args:
+        try:
+            limit = int(args['limit'])
+        except ValueError:
+            return filters, 'limit must be an integer'
+        if limit < 1:
+            return filters, 'limit must be positive'
+        filters['limit'] = min(limit, app.config['TASKS_PAGE_LIMIT'])
+    if 'after' in args:
+        filters['after'] = service.decode_cursor(args['after'])
+        if filters['after'] is None:
+            return filters, 'wrong cursor in after'
+    if 'done' in args:
+        if args['done'].lower() not in ('true', 'false', '1', '0'):
+            return filters, 'done must be true or false'
+        filters['done'] = args['done'].lower() in ('true', '1')
+    for field in ('deadline_from', 'deadline_to'):
+        if field in args:
+            try:
+                filters[field] = datetime.strptime(args[field], "%Y-%m-%d %H:%M")
+            except ValueError:
+                return filters, f'wrong format {field} (yyyy-mm-dd hh:mm)'
+    return filters, None
+
+
+def parse_within(value: str) -> timedelta:
+    """Parses a period like 30m, 24h or 7d, a number without a unit is hours
+
+    :return: timedelta or None if the value is invalid
+
+    """
+
+    units = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days'}
+    unit = value[-1:].lower()
+    number = value[:-1] if unit in units else value
+    try:
+        amount = float(number)
+        if not math.isfinite(amount) or amount <= 0:
+            return None
+        return timedelta(**{units.get(unit, 'hours'): amount})
+    except (ValueError, OverflowError):
+        return None
+
+
+def deadline_tasks(**window) -> object:
+    """Response with the user's uncompleted tasks with a deadline in the window
+
+    :param window: deadline_from and/or deadline_to, replace the same query parameters
+    :return: {"tasks": [...], "next": cursor} if limit is given
+
+    """
+
+    filters, error = task_filters()
+    if error is not None:
+        return bad_request(error)
+    filters.update(window, done=False)
+    rows = service.get_task_rows(g.user, **filters)
+    with metrics.timer('serialization'):
+        response = {'tasks': [serializers.task_row_to_dict(row) for row in rows]}
+    if 'limit' in filters:
+        response['next'] = service.encode_cursor(rows[-1]) if len(rows) == filters['limit'] else None
+    return encoding.data_response(response)
+
+
+def stream_tasks(rows, ndjson: bool):
+    """Serializes tasks one by one so memory does not grow with the number of tasks
+
+    :param rows: iterator of rows of serializers.TASK_COLUMNS
+    :param ndjson: one task per line instead of the {"tasks": [...]} object
+    :return: generator of response chunks
+
+    """
+
+    if ndjson:
+        for row in rows:
+            yield serializers.dumps(serializers.task_row_to_dict(row)) + b'\n'
+        return
+    yield b'{"tasks":['
+    separator = b''
+    for row in rows:
+        yield separator + serializers.dumps(serializers.task_row_to_dict(row))
+        separator = b','
+    yield b']}\n'
+
+
+def task_ids() -> (list, str):
+    """Reads the ids of tasks for bulk operations from the json body {"ids": [1, 2, 3]}
+
+    :return: (ids, error): list of ids and an error message or None
+
+    """
+
+    data = request.get_json() or {}
+    if not data:
+        return None, 'missing json request'
+    elif not isinstance(data, dict) or 'ids' not in data:
+        return None, 'the ids field is missing'
+    ids = data['ids']
+    if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) and i in INTEGER_RANGE
+                                            for i in ids):
+        return None, 'ids must be a list of integers'
+    elif len(ids) > app.config['BULK_TASKS_LIMIT']:
+        return None, f'no more than {app.config["BULK_TASKS_LIMIT"]} ids per request'
+    return ids, None
+
+
+def bulk_response(result: (int, str, list), ids: list) -> object:
+    if result[0] == 2:
+        return server_error(result[1])
+    matched = set(result[2])
+    response = {'status': 200, 'message': result[1], 'ids': result[2],
+                'not_found': sorted(set(ids) - matched)}
+    return make_response(jsonify(response), 200)
+
+
+def job_accepted(message: str, job) -> object:
+    """Response 202 to a request continued by a background job, the status is at url/jobs/<id>"""
+
+    response = make_response(jsonify({'status': 202, 'message': message, 'job': job.to_dict()}), 202)
+    response.headers['Location'] = url_for('get_job', job_id=job.id)
+    return response
+
+
+def tasks_etag() -> str:
+    """ETag of a task response, changes with the version of the user's tasks and with the request"""
+
+    key = f'{g.user.id}:{g.user.tasks_version}:{request.full_path}:' \
+          f'{request.accept_mimetypes}:{request.accept_encodings}'
+    return sha1(key.encode()).hexdigest()
+
+
+def with_etag(response: Response, etag: str) -> Response:
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def not_modified(etag: str) -> Response:
+    return with_etag(Response(status=304), etag)
+
+
+def rate_limited(view):
+    """Applies the limit of the route to the authenticated user, see app.config['RATE_LIMITS']"""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.environ.get(LONG_POLL_RETRY):  # Продолжение уже учтенного запроса
+            return view(*args, **kwargs)
+        # Ключ - логин пользователя, а не auth.username(): иначе каждый токен получил бы свой лимит
+        wait = rate_limiter.check(request.endpoint, g.user.login)
+        if wait:
+            return too_many_requests(f'rate limit of {request.endpoint} exceeded', wait)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def coalesced(view):
+    """Concurrent identical requests of a user share one database query and serialization
+
+    The key is the ETag of the request, so only requests for the same version of the same
+    user's tasks with the same parameters are coalesced. Streamed responses are not shared.
+
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = tasks_etag()
+        if request.if_none_match.contains(etag):
+            return view(*args, **kwargs)
+
+        def respond() -> (Response, tuple):
+            response = make_response(view(*args, **kwargs))
+            if response.is_streamed:
+                return response, None
+            # Копия до обработчиков after_request, которые меняют ответ (сжатие)
+            return response, (response.get_data(), response.status_code, list(response.headers))
+
+        (response, copy), shared = single_flight.do(etag, respond)
+        if not shared:
+            return response
+        if copy is None:
+            return view(*args, **kwargs)
+        return app.response_class(*copy)
+    return wrapper
+
+
 # Route block
 
+@lru_cache(maxsize=None)
+def index_page() -> str:
+    """The index page is static, the template is rendered once per process"""
+
+    return render_template("index.html")
+
+
 # Web-инструкция к API List of Tasks
 @app.route('/')
 def index():
-    return render_template("index.html")
+    response = app.response_class(index_page(), mimetype='text/html')
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+# Метрики производительности в формате Prometheus
+@app.route('/metrics', methods=['GET'])
+def get_metrics() -> object:
+    return app.response_class(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Обменять логин и пароль на токен доступа
+@app.route('/token', methods=['GET'])
+@auth.login_required
+@rate_limited
+def get_token() -> object:
+    if g.token_auth:
+        return unauthorized('a token is issued only for login and password')
+    response = {'token': g.user.generate_auth_token(), 'expiration': app.config['TOKEN_EXPIRATION']}
+    return make_response(jsonify(response), 200)
 
 
 # Получить список всех задач
 @app.route('/tasks', methods=['GET'])
 @auth.login_required
+@rate_limited
+@coalesced
 def get_tasks():
-    user = service.check_login(auth.username())  # Если существует возвращает объект User
-    if user is None:
-        return server_error('user`s none')
-    tasks = service.get_tasks(user)
-    return make_response(jsonify({'tasks': [task.to_dict() for task in tasks]}), 200)
+    filters, error = task_filters()
+    if error is not None:
+        return bad_request(error)
+    etag = tasks_etag()
+    if request.if_none_match.contains(etag):  # Список не менялся с прошлого запроса
+        return not_modified(etag)
+    ndjson = request.accept_mimetypes.best == 'application/x-ndjson'
+    if ndjson or request.args.get('stream') == '1':  # Потоковая выдача без накопления списка в памяти
+        rows = service.iter_task_rows(g.user, app.config['STREAM_CHUNK_SIZE'], **filters)
+        response = Response(stream_with_context(stream_tasks(rows, ndjson)), 200,
+                            mimetype='application/x-ndjson' if ndjson else 'application/json')
+        return with_etag(response, etag)
+    if not filters and not encoding.wants_msgpack():  # Полный список в JSON берется из кэша
+        data = tasks_cache.get(g.user.id, g.user.login, g.user.tasks_version)
+        if data is None:
+            rows = service.get_task_rows(g.user)
+            with metrics.timer('serialization'):
+                tasks = [serializers.task_row_to_dict(row) for row in rows]
+            response = encoding.data_response({'tasks': tasks})  # Время кодирования учитывает data_response
+            tasks_cache.set(g.user.id, g.user.login, g.user.tasks_version, response.get_data())
+        else:
+            response = app.response_class(data, mimetype=app.config['JSONIFY_MIMETYPE'])
+            response.vary.add('Accept')
+        return with_etag(response, etag)
+    rows = service.get_task_rows(g.user, **filters)
+    with metrics.timer('serialization'):
+        response = {'tasks': [serializers.task_row_to_dict(row) for row in rows]}
+    if 'limit' in filters:  # Курсор следующей страницы, None - страниц больше нет
+        response['next'] = service.encode_cursor(rows[-1]) if len(rows) == filters['limit'] else None
+    return with_etag(encoding.data_response(response), etag)
+
+
+def wait_changes(user_id: int, since: int, wait: float) -> (list, dict):
+    """Waits for changes of the user's tasks in the thread of the request, for WSGI servers
+
+    A waiting request holds its thread, so at most CHANGES_MAX_WAITERS requests of the process wait.
+
+    :return: (events, tasks) as returned by service.get_changes, (None, None) if too many requests wait
+
+    """
+
+    if wait > 0 and not change_waiters.acquire(blocking=False):
+        return None, None
+    finish = monotonic() + wait
+    try:
+        while True:
+            version = change_notifier.version(user_id)
+            events, tasks = service.get_changes(user_id, since, app.config['CHANGES_LIMIT'])
+            remaining = finish - monotonic()
+            if events or remaining <= 0:
+                return events, tasks
+            db.session.close()  # Соединение с базой не удерживается во время ожидания
+            # Изменения из других процессов видны только при опросе базы
+            change_notifier.wait(user_id, version, min(remaining, app.config['CHANGES_POLL_INTERVAL']))
+    finally:
+        if wait > 0:
+            change_waiters.release()
+
+
+# Лента изменений задач (long polling)
+@app.route('/tasks/changes', methods=['GET'])
+@auth.login_required
+@rate_limited
+def get_changes() -> object:
+    user_id = g.user.id
+    if 'since' not in request.args:  # Текущий курсор, с которого начинается опрос
+        return make_response(jsonify({'events': [], 'cursor': service.last_change(user_id)}), 200)
+    try:
+        since = int(request.args['since'])
+        wait = float(request.args.get('wait', app.config['CHANGES_WAIT']))
+    except ValueError:
+        return bad_request('since and wait must be numbers')
+    if not math.isfinite(wait) or since not in INTEGER_RANGE:
+        return bad_request('since and wait must be numbers')
+    wait = min(max(wait, 0), app.config['CHANGES_WAIT'])
+    if LONG_POLL in request.environ:  # Мост ASGI ждет изменений в цикле событий, поток не занимается
+        long_poll = request.environ[LONG_POLL]
+        version = change_notifier.version(user_id)
+        events, tasks = service.get_changes(user_id, since, app.config['CHANGES_LIMIT'])
+        if not events and wait > 0 and long_poll is not None:
+            long_poll.update(user_id=user_id, version=version, wait=wait,
+                             interval=app.config['CHANGES_POLL_INTERVAL'])
+            return make_response('', 204)  # Ответ не отправляется, запрос будет вызван снова
+    else:
+        events, tasks = wait_changes(user_id, since, wait)
+        if events is None:
+            return service_unavailable('too many waiting requests', app.config['CHANGES_POLL_INTERVAL'])
+    response = {'events': [], 'cursor': events[-1].id if events else since}
+    for event in events:
+        data = event.to_dict()
+        if event.kind in ('create', 'done', 'due'):
+            task = tasks.get(event.task_id)
+            data['task'] = task.to_dict() if task is not None else None  # None - задача уже удалена
+        response['events'].append(data)
+    return encoding.data_response(response)
+
+
+# Невыполненные задачи с прошедшим сроком
+@app.route('/tasks/overdue', methods=['GET'])
+@auth.login_required
+@rate_limited
+def get_overdue_tasks() -> object:
+    return deadline_tasks(deadline_to=datetime.now())
+
+
+# Невыполненные задачи со сроком в ближайший период (?within=24h)
+@app.route('/tasks/upcoming', methods=['GET'])
+@auth.login_required
+@rate_limited
+def get_upcoming_tasks() -> object:
+    within = parse_within(request.args.get('within', app.config['UPCOMING_WITHIN']))
+    now = datetime.now()
+    try:
+        deadline_to = now + within if within is not None else None
+    except OverflowError:  # Конец периода позже 9999 года
+        deadline_to = None
+    if deadline_to is None:
+        return bad_request('within must be a positive period, e.g. 30m, 24h or 7d')
+    return deadline_tasks(deadline_from=now, deadline_to=deadline_to)
 
 
 # Получить задачу по id
-@app.route('/tasks/<int:task_id>', methods=['GET'])
+@app.route(f'/tasks/<int(max={TASK_ID_MAX}):task_id>', methods=['GET'])
 @auth.login_required
+@rate_limited
+@coalesced
 def get_task(task_id: int):
-    user = service.check_login(auth.username())  # Если существует возвращает объект User
-    if user is None:
-        return server_error('user`s none')
-    task = service.get_task(user, task_id)
+    etag = tasks_etag()
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+    task = service.get_task(g.user, task_id)
     if task is None:
         return not_found(f'task {task_id} was not found')
-    return make_response(jsonify(task.to_dict()), 200)
+    return with_etag(encoding.data_response(task.to_dict()), etag)
 
 
 # Отметить задачу как выполненную
-@app.route('/done/<int:task_id>', methods=['PUT'])
+@app.route(f'/done/<int(max={TASK_ID_MAX}):task_id>', methods=['PUT'])
 @auth.login_required
+@rate_limited
 def done_task(task_id: int) -> object:
-    user = service.check_login(auth.username())  # Если существует возвращает объект User
-    task = service.done_task(user, task_id)
+    task = service.done_task(g.user, task_id)
     if task[0] == 1:
         return not_found(task[1])
     elif task[0] == 2:
@@ -62,21 +434,26 @@ def done_task(task_id: int) -> object:
     return make_response(jsonify(response), 200)
 
 
+# Отметить несколько задач как выполненные
+@app.route('/done_tasks', methods=['PUT'])
+@auth.login_required
+@rate_limited
+def done_tasks() -> object:
+    ids, error = task_ids()
+    if error is not None:
+        return bad_request(error)
+    return bulk_response(service.done_tasks(g.user, ids), ids)
+
+
 # Создать задачу
 @app.route('/create_task', methods=['POST'])
 @auth.login_required
+@rate_limited
 def create_task() -> object:
-    user = service.check_login(auth.username())  # Если существует возвращает объект User
     data = request.get_json() or {}
     if not data:
         return bad_request('missing json request')
-    elif 'title' not in data:
-        return bad_request('the title field is missing')
-    elif 'description' not in data:
-        return bad_request('the description field is missing')
-    elif 'deadline' not in data:
-        return bad_request('the deadline field is missing')
-    task = service.create_task(data, user)
+    task = service.create_task(data, g.user)
     if task[0] == 1:
         return bad_request(task[1])
     elif task[0] == 2:
@@ -85,6 +462,77 @@ def create_task() -> object:
     return make_response(jsonify(response), 201)
 
 
+# Создать несколько задач одним запросом
+@app.route('/create_tasks', methods=['POST'])
+@auth.login_required
+@rate_limited
+def create_tasks() -> object:
+    data = request.get_json() or {}
+    if not data:
+        return bad_request('missing json request')
+    elif not isinstance(data, list):
+        return bad_request('a json array of tasks is expected')
+    elif len(data) > app.config['BULK_TASKS_LIMIT']:
+        return bad_request(f'no more than {app.config["BULK_TASKS_LIMIT"]} tasks per request')
+    elif len(data) > app.config['BULK_TASKS_ASYNC_THRESHOLD']:  # Большой пакет создается в фоне
+        result = service.start_create_tasks(data, g.user)
+        if result[0] == 2:
+            return server_error(result[1])
+        return job_accepted(result[1], result[2])
+    result = service.create_tasks(data, g.user)
+    if result[0] == 2:
+        return server_error(result[1])
+    status = 400 if result[0] == 1 else 201
+    response = {'status': status, 'message': result[1], 'created': result[2], 'errors': result[3]}
+    return make_response(jsonify(response), status)
+
+
+# Выгрузить все задачи пользователя: ?format=ndjson (по умолчанию) или csv
+@app.route('/export', methods=['GET'])
+@auth.login_required
+@rate_limited
+def export_tasks() -> object:
+    file_format = request.args.get('format') or ('csv' if request.accept_mimetypes.best == 'text/csv' else 'ndjson')
+    if file_format not in serializers.FILE_FORMATS:
+        return bad_request('format must be ndjson or csv')
+    rows = service.iter_task_rows(g.user, app.config['STREAM_CHUNK_SIZE'])
+    body = serializers.csv_lines(rows) if file_format == 'csv' else stream_tasks(rows, True)
+    response = Response(stream_with_context(body), 200, mimetype=serializers.FILE_FORMATS[file_format][0])
+    response.headers['Content-Disposition'] = f'attachment; filename=tasks.{file_format}'
+    return response
+
+
+# Загрузить задачи из файла NDJSON или CSV, большой файл загружается в фоне
+@app.route('/import', methods=['POST'])
+@auth.login_required
+@rate_limited
+def import_tasks() -> object:
+    formats = {mimetype: name for name, (mimetype, _) in serializers.FILE_FORMATS.items()}
+    if request.mimetype not in formats:
+        return bad_request(f'the body must be {" or ".join(formats)}')
+    file_format = formats[request.mimetype]
+    if request.content_length is None or request.content_length > app.config['IMPORT_ASYNC_SIZE']:
+        file = tempfile.NamedTemporaryFile(prefix='list-tasks-import-', delete=False)
+        try:
+            with file:
+                shutil.copyfileobj(request.stream, file)
+            result = service.start_import_tasks(file.name, file_format, g.user)
+        except Exception:  # Например, клиент отключился во время загрузки: файл не передан заданию
+            os.remove(file.name)
+            raise
+        if result[0] == 2:
+            return server_error(result[1])
+        return job_accepted(result[1], result[2])
+    _, read = serializers.FILE_FORMATS[file_format]
+    result = service.import_tasks(read(request.stream), g.user, app.config['IMPORT_BATCH_SIZE'])
+    if result[0] == 2:
+        return server_error(result[1])
+    status = 400 if result[0] == 1 else 201
+    response = {'status': status, 'message': result[1], 'created': result[2], 'errors': result[3],
+                'failed': result[4]}
+    return make_response(jsonify(response), status)
+
+
 # Создать пользователя
 @app.route('/create_user', methods=['POST'])
 def create_user() -> object:
@@ -105,10 +553,11 @@ def create_user() -> object:
 
 
 # Удалить задачу
-@app.route('/delete_task/<int:task_id>', methods=['DELETE'])
+@app.route(f'/delete_task/<int(max={TASK_ID_MAX}):task_id>', methods=['DELETE'])
 @auth.login_required
+@rate_limited
 def delete_task(task_id: int) -> object:
-    task = service.delete_task(task_id)
+    task = service.delete_task(g.user, task_id)
     if task[0] == 1:
         return not_found(task[1])
     elif task[0] == 2:
@@ -117,14 +566,35 @@ def delete_task(task_id: int) -> object:
     return make_response(jsonify(response))
 
 
+# Удалить несколько задач
+@app.route('/delete_tasks', methods=['DELETE'])
+@auth.login_required
+@rate_limited
+def delete_tasks() -> object:
+    ids, error = task_ids()
+    if error is not None:
+        return bad_request(error)
+    return bulk_response(service.delete_tasks(g.user, ids), ids)
+
+
+# Статус фонового задания, id задания служит ключом доступа
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id: str) -> object:
+    job = service.get_job(job_id)
+    if job is None:
+        return not_found(f'job {job_id} was not found')
+    return make_response(jsonify(job.to_dict()), 200)
+
+
 # Удалить пользователя
 @app.route('/delete_user', methods=['DELETE'])
 @auth.login_required
+@rate_limited
 def delete_user() -> object:
-    result = service.delete_user(auth.username())
-    if result[0] == 1:
-        return not_found(result[1])
-    elif result[0] == 2:
+    result = service.delete_user(g.user)
+    if result[0] == 2:
         return server_error(result[1])
+    elif result[0] == 3:
+        return job_accepted(result[1], result[2])
     response = {'status': 200, 'message': result[1]}
     return make_response(jsonify(response))
@@ -0,0 +1,35 @@
+"""Periodic jobs of the app List of tasks run by the flask command
+"""
+from datetime import datetime, timedelta
+from time import sleep
+
+import click
+
+from app import app, db
+import app.model.services as service
+
+
+# Записать события due для задач с наступившим сроком, удалить старые события и завершить потерянные
+# задания: flask notify-due [--loop]
+@app.cli.command('notify-due')
+@click.option('--batch-size', type=int, default=None, help='tasks per transaction, DUE_BATCH_SIZE by default')
+@click.option('--loop', is_flag=True, help='repeat every DUE_INTERVAL seconds until interrupted')
+def notify_due(batch_size: int, loop: bool):
+    """Writes due events to /tasks/changes, deletes events older than EVENTS_RETENTION days, recovers lost jobs"""
+
+    batch_size = batch_size or app.config['DUE_BATCH_SIZE']
+    while True:
+        code, message, _ = service.notify_due_tasks(datetime.now(), batch_size)
+        db.session.remove()
+        click.echo(message, err=bool(code))
+        if app.config['EVENTS_RETENTION']:
+            before = datetime.utcnow() - timedelta(days=app.config['EVENTS_RETENTION'])
+            code, message, _ = service.prune_events(before, batch_size)
+            db.session.remove()
+            click.echo(message, err=bool(code))
+        code, message, _ = service.recover_jobs(datetime.utcnow() - timedelta(seconds=app.config['JOB_TIMEOUT']))
+        db.session.remove()
+        click.echo(message, err=bool(code))
+        if not loop:
+            break
+        sleep(app.config['DUE_INTERVAL'])
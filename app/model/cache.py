@@ -0,0 +1,274 @@
+"""Caches of the app List of tasks
+"""
+import hmac
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+from time import monotonic, time
+
+
+class CredentialCache(object):
+    """Bounded TTL cache of recently verified credentials
+
+    Stores an HMAC digest of the password (never the password itself) together with
+    the password hash it was verified against, so a changed password misses the cache.
+
+    """
+
+    def __init__(self, secret: str, size: int = 1024, ttl: int = 300):
+        """
+        :param secret: key for the HMAC digest of passwords
+        :param size: maximum number of entries, 0 disables the cache
+        :param ttl: lifetime of an entry in seconds
+
+        """
+
+        self.secret = secret.encode()
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # login -> (digest, password_hash, expires)
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _digest(self, password: str) -> bytes:
+        return hmac.new(self.secret, password.encode(), sha256).digest()
+
+    def check(self, login: str, password_hash: str, password: str) -> bool:
+        """Checks that the password was recently verified for the user
+
+        :param login: User`s login
+        :param password_hash: current password hash of the user
+        :param password: password to check
+        :return: True on a cache hit
+
+        """
+
+        if not self.size:
+            return False
+        digest = self._digest(password)
+        with self._lock:
+            entry = self._entries.get(login)
+            if entry is not None:
+                if entry[2] > monotonic() and entry[1] == password_hash and hmac.compare_digest(entry[0], digest):
+                    self._entries.move_to_end(login)
+                    self.hits += 1
+                    return True
+                if entry[2] <= monotonic() or entry[1] != password_hash:
+                    del self._entries[login]
+            self.misses += 1
+        return False
+
+    def add(self, login: str, password_hash: str, password: str):
+        """Remembers a successfully verified password
+
+        :param login: User`s login
+        :param password_hash: password hash the password was verified against
+        :param password: verified password
+
+        """
+
+        if not self.size:
+            return
+        entry = (self._digest(password), password_hash, monotonic() + self.ttl)
+        with self._lock:
+            self._entries[login] = entry
+            self._entries.move_to_end(login)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, login: str):
+        """Drops the cached credentials of the user
+
+        :param login: User`s login
+
+        """
+
+        with self._lock:
+            self._entries.pop(login, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class LRUCache(object):
+    """In-process cache backend with least recently used eviction"""
+
+    def __init__(self, size: int = 1024, max_bytes: int = None):
+        """
+        :param size: maximum number of entries, 0 disables the cache
+        :param max_bytes: maximum total size of the values in bytes, None - unlimited
+
+        """
+
+        self.size = size
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> bytes:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes):
+        if not self.size:
+            return
+        with self._lock:
+            self._pop(key)
+            # Значение больше всего кэша не сохраняется, чтобы не вытеснять остальные
+            if self.max_bytes is not None and len(value) > self.max_bytes:
+                return
+            self._entries[key] = value
+            self.bytes += len(value)
+            while len(self._entries) > self.size or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                self.bytes -= len(self._entries.popitem(last=False)[1])
+
+    def delete(self, key: str):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _pop(self, key: str):
+        value = self._entries.pop(key, None)
+        if value is not None:
+            self.bytes -= len(value)
+
+
+class RedisCache(object):
+    """Cache backend shared by processes, works with any Redis-compatible server
+
+    Requires the redis package, which is not installed by default.
+
+    """
+
+    def __init__(self, url: str, ttl: int = 300, prefix: str = 'list-tasks:'):
+        """
+        :param url: server url, e.g. redis://localhost:6379/0
+        :param ttl: lifetime of an entry in seconds
+        :param prefix: prefix of the keys
+
+        """
+
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> bytes:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes):
+        self.client.set(self.prefix + key, value, ex=self.ttl)
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+class TaskListCache(object):
+    """Read-through cache of serialized task lists of users
+
+    Every entry is stored with the version of the user's tasks (User.tasks_version) it was
+    built from, an entry of another version is a miss. So a list cached by a request that
+    raced with a write is never served after the write, even if another process made it.
+
+    """
+
+    def __init__(self, backend):
+        """
+        :param backend: LRUCache, RedisCache or any object with get, set, delete and clear
+
+        """
+
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, user_id: int, login: str, version: int) -> bytes:
+        """Gets the serialized task list
+
+        :param user_id: id of the user
+        :param login: login of the user, ids of deleted users may be reused by SQLite
+        :param version: current version of the user's tasks
+        :return: serialized list or None on a miss
+
+        """
+
+        value = self.backend.get(f'tasks:{user_id}:{login}')
+        if value is not None:
+            cached_version, _, data = value.partition(b':')
+            if int(cached_version) == version:
+                self.hits += 1
+                return data
+        self.misses += 1
+        return None
+
+    def set(self, user_id: int, login: str, version: int, data: bytes):
+        self.backend.set(f'tasks:{user_id}:{login}', b'%d:%s' % (version, data))
+
+    def invalidate(self, user_id: int, login: str):
+        self.backend.delete(f'tasks:{user_id}:{login}')
+
+    def clear(self):
+        self.backend.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class RecentWrites(object):
+    """Users who changed their data in the last seconds, for read-your-writes on a replica
+
+    Entries hold the wall-clock end of the window, so the backend may be shared by processes.
+
+    """
+
+    def __init__(self, backend, window: float):
+        """
+        :param backend: LRUCache, RedisCache or any object with get, set, delete and clear
+        :param window: seconds after a write during which reads of the user use the primary database
+
+        """
+
+        self.backend = backend
+        self.window = window
+
+    def mark(self, login: str):
+        self.backend.set(f'writes:{login}', b'%f' % (time() + self.window))
+
+    def check(self, login: str) -> bool:
+        """Checks that the user wrote data during the last window seconds"""
+
+        value = self.backend.get(f'writes:{login}')
+        return value is not None and float(value) > time()
+
+    def clear(self):
+        self.backend.clear()
@@ -0,0 +1,66 @@
+"""Notifications about changes of users' tasks inside the process
+"""
+from threading import Condition
+
+# Ключи environ, которыми мост ASGI (app/asgi.py) переносит ожидание изменений в цикл событий:
+# словарь, в который обработчик записывает {'user_id', 'version', 'wait', 'interval'} вместо
+# ожидания в потоке, или None - последний вызов, ответ нужен сразу
+LONG_POLL = 'asgi.long_poll'
+LONG_POLL_RETRY = 'asgi.long_poll_retry'  # Повторный вызов того же запроса после ожидания
+
+
+class ChangeNotifier(object):
+    """Wakes up requests waiting for changes of a user's tasks
+
+    Works inside one process only, waiters must also poll the database to see
+    changes made by other processes.
+
+    """
+
+    def __init__(self):
+        self._condition = Condition()
+        self._versions = {}  # user_id -> число уведомлений
+        self._callbacks = {}  # user_id -> функции, вызываемые при уведомлении
+
+    def version(self, user_id: int) -> int:
+        with self._condition:
+            return self._versions.get(user_id, 0)
+
+    def notify(self, user_ids: set):
+        with self._condition:
+            for user_id in user_ids:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+                for callback in self._callbacks.get(user_id, ()):
+                    callback()
+            self._condition.notify_all()
+
+    def subscribe(self, user_id: int, callback):
+        """Calls the callback on every notification about the user, e.g. to wake up an event loop
+
+        :param user_id: id of the user
+        :param callback: function without arguments, called in the notifying thread and must not block
+
+        """
+
+        with self._condition:
+            self._callbacks.setdefault(user_id, set()).add(callback)
+
+    def unsubscribe(self, user_id: int, callback):
+        with self._condition:
+            callbacks = self._callbacks.get(user_id, set())
+            callbacks.discard(callback)
+            if not callbacks:
+                self._callbacks.pop(user_id, None)
+
+    def wait(self, user_id: int, version: int, timeout: float) -> bool:
+        """Waits for a notification about the user after the given version
+
+        :param user_id: id of the user
+        :param version: value of version(user_id) seen by the caller
+        :param timeout: maximum waiting time in seconds
+        :return: True if the user was notified
+
+        """
+
+        with self._condition:
+            return self._condition.wait_for(lambda: self._versions.get(user_id, 0) != version, timeout)
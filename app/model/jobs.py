@@ -0,0 +1,47 @@
+"""Background jobs of the app List of tasks
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Lock
+
+
+class JobExecutor(object):
+    """Runs heavy operations in a pool of threads of the process
+
+    The state of the jobs is kept in the table job by app.model.services, so it can be read
+    by any process. No external broker is needed, jobs of a stopped process are lost and
+    finished later by services.recover_jobs.
+
+    """
+
+    def __init__(self, workers: int):
+        """
+        :param workers: number of threads running jobs
+
+        """
+
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='job')
+        self._futures = set()
+        self._lock = Lock()
+
+    def submit(self, function, *args):
+        future = self._executor.submit(function, *args)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._forget)
+        return future
+
+    def _forget(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def wait(self, timeout: float = None) -> bool:
+        """Waits for the submitted jobs
+
+        :param timeout: maximum waiting time in seconds
+        :return: True if all jobs are finished
+
+        """
+
+        with self._lock:
+            futures = list(self._futures)
+        return not wait(futures, timeout).not_done
@@ -0,0 +1,200 @@
+"""Rate limiting and coalescing of requests of the app List of tasks
+"""
+from collections import OrderedDict
+from threading import Lock, Event
+from time import monotonic
+
+
+def parse_limits(value: str) -> dict:
+    """Parses limits of routes
+
+    :param value: comma separated "endpoint=rate/burst", e.g. "get_tasks=20/100,*=50/200",
+        rate is requests per second, burst is the size of the bucket, * applies to other routes
+    :return: {endpoint: (rate, burst)}
+
+    """
+
+    limits = {}
+    for item in filter(None, (item.strip() for item in (value or '').split(','))):
+        endpoint, _, limit = item.partition('=')
+        rate, _, burst = limit.partition('/')
+        limits[endpoint.strip()] = (float(rate), float(burst or rate))
+    return limits
+
+
+class MemoryBucketStore(object):
+    """Token buckets in the memory of the process, least recently used buckets are evicted"""
+
+    def __init__(self, size: int = 10000):
+        """
+        :param size: maximum number of buckets, an evicted bucket starts full again
+
+        """
+
+        self.size = size
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._lock = Lock()
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        """Takes a token from the bucket
+
+        :param key: key of the bucket
+        :param rate: tokens added per second
+        :param burst: capacity of the bucket
+        :return: 0 if a token was taken, otherwise seconds until the next token
+
+        """
+
+        now = monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1 if not wait else tokens, now)
+            while len(self._buckets) > self.size:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def reset(self, key: str):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisBucketStore(object):
+    """Token buckets shared by processes, works with any Redis-compatible server
+
+    Requires the redis package, which is not installed by default.
+
+    """
+
+    SCRIPT = """
+        local now = redis.call('TIME')
+        now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+        local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = math.min(burst, (tonumber(bucket[1]) or burst) + (now - (tonumber(bucket[2]) or now)) * rate)
+        local wait = 0
+        if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+        redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+        return tostring(wait)
+    """
+
+    def __init__(self, url: str, prefix: str = 'list-tasks:limit:'):
+        """
+        :param url: server url, e.g. redis://localhost:6379/0
+        :param prefix: prefix of the keys
+
+        """
+
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(self.SCRIPT)
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        return float(self._take(keys=[self.prefix + key], args=[rate, burst]))
+
+    def reset(self, key: str):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+class RateLimiter(object):
+    """Per-user token bucket limits of routes"""
+
+    def __init__(self, store, limits: dict):
+        """
+        :param store: MemoryBucketStore, RedisBucketStore or any object with take, reset and clear
+        :param limits: {endpoint: (rate, burst)} as returned by parse_limits
+
+        """
+
+        self.store = store
+        self.limits = limits
+        self.rejected = 0
+
+    def check(self, endpoint: str, login: str) -> float:
+        """Counts a request of the user to the route
+
+        :param endpoint: name of the route
+        :param login: User`s login
+        :return: 0 if the request is allowed, otherwise seconds to wait before retrying
+
+        """
+
+        limit = self.limits.get(endpoint) or self.limits.get('*')
+        if limit is None:
+            return 0.0
+        wait = self.store.take(f'{endpoint}:{login}', *limit)
+        if wait:
+            self.rejected += 1
+        return wait
+
+    def reset(self, login: str):
+        """Drops the buckets of the user
+
+        :param login: User`s login
+
+        """
+
+        for endpoint in self.limits:
+            self.store.reset(f'{endpoint}:{login}')
+
+    def clear(self):
+        self.store.clear()
+        self.rejected = 0
+
+
+class SingleFlight(object):
+    """Runs a function once for concurrent calls with the same key
+
+    Callers arriving while the first call with their key is running wait for it
+    and share its result instead of repeating the work.
+
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> [Event, result, failed]
+        self._lock = Lock()
+        self.shared = 0
+
+    def do(self, key: str, function) -> (object, bool):
+        """Calls the function or waits for the running call with the same key
+
+        :param key: key of the call
+        :param function: function without arguments
+        :return: (result, shared): result of the function and whether it came from another caller,
+            a caller waiting for a failed call runs the function itself
+
+        """
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = [Event(), None, True]
+        if not leader:
+            call[0].wait()
+            if not call[2]:
+                with self._lock:
+                    self.shared += 1
+                return call[1], True
+            return function(), False
+        try:
+            call[1] = function()
+            call[2] = False
+            return call[1], False
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call[0].set()
@@ -1,9 +1,22 @@
+import json
+from datetime import datetime
+from hashlib import sha256
+
+from itsdangerous import URLSafeTimedSerializer, BadSignature
 from werkzeug.security import generate_password_hash, check_password_hash
 
-from app import db
+from app import app, db, credential_cache
+
+token_serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='auth-token')
+INTEGER_RANGE = range(-2 ** 63, 2 ** 63)  # Значения INTEGER SQLite, большее число не передать в запрос
 
 
 class Task(db.Model):
+    __table_args__ = (db.Index('ix_task_user_id_id', 'user_id', 'id'),
+                      db.Index('ix_task_user_id_deadline_id', 'user_id', 'deadline', 'id'),
+                      db.Index('ix_task_user_id_done_deadline', 'user_id', 'done', 'deadline'),
+                      db.Index('ix_task_done_deadline', 'done', 'deadline'))  # Поиск наступивших сроков всех пользователей
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(64))
     description = db.Column(db.String(256))
@@ -18,7 +31,7 @@ class Task(db.Model):
         data = {'id': self.id,
                 'title': self.title,
                 'description': self.description,
-                'deadline': self.deadline.strftime("%Y-%m-%d %H:%M"),
+                'deadline': self.deadline.isoformat(' ', 'minutes'),
                 'done': self.done}
         return data
 
@@ -28,10 +41,65 @@ class Task(db.Model):
                 setattr(self, field, data[field])
 
 
+class TaskEvent(db.Model):
+    __table_args__ = (db.Index('ix_task_event_user_id_id', 'user_id', 'id'),
+                      {'sqlite_autoincrement': True})  # id - курсор ленты изменений, не должен повторяться
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    task_id = db.Column(db.Integer)
+    kind = db.Column(db.String(16))  # create, done, delete, due - наступил срок или reload - перечитать весь список
+    created = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<TaskEvent {self.kind} {self.task_id}>'
+
+    def to_dict(self) -> dict:
+        data = {'id': self.id,
+                'type': self.kind,
+                'task_id': self.task_id}
+        return data
+
+
+class Job(db.Model):
+    id = db.Column(db.String(32), primary_key=True)  # Случайный id, он же доступ к статусу задания
+    user_id = db.Column(db.Integer)  # Без внешнего ключа: задание delete_user переживает пользователя
+    kind = db.Column(db.String(32))
+    status = db.Column(db.String(16), default='queued')  # queued, running, done или failed
+    message = db.Column(db.String(256))
+    result = db.Column(db.Text)  # JSON с результатом задания
+    created = db.Column(db.DateTime, default=datetime.utcnow)
+    finished = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<Job {self.kind} {self.status}>'
+
+    def to_dict(self) -> dict:
+        data = {'id': self.id,
+                'type': self.kind,
+                'status': self.status,
+                'message': self.message,
+                'result': json.loads(self.result) if self.result else None,
+                'created': self.created.isoformat(' ', 'seconds'),
+                'finished': self.finished.isoformat(' ', 'seconds') if self.finished else None}
+        return data
+
+
+class SchedulerState(db.Model):
+    """Position of a periodic job, e.g. the cursor of the last task with a notified deadline"""
+
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.String(256))
+
+    def __repr__(self):
+        return f'<SchedulerState {self.name}={self.value}>'
+
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     login = db.Column(db.String(64), index=True, unique=True)
     password_hash = db.Column(db.String(128))
+    tasks_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     tasks = db.relationship('Task', backref='owner', lazy='dynamic')
 
     def __repr__(self):
@@ -39,6 +107,41 @@ class User(db.Model):
 
     def set_password(self, password: str):
         self.password_hash = generate_password_hash(password)
+        credential_cache.invalidate(self.login)
 
     def check_password(self, password: str) -> bool:
         return check_password_hash(self.password_hash, password)
+
+    def password_fingerprint(self) -> str:
+        """Short digest of the password hash, changes with the password"""
+
+        return sha256(self.password_hash.encode()).hexdigest()[:16]
+
+    def generate_auth_token(self) -> str:
+        return token_serializer.dumps({'login': self.login, 'id': self.id, 'password': self.password_fingerprint()})
+
+    def check_auth_token(self, data: dict) -> bool:
+        """Checks that the token was issued to this user with the current password
+
+        :param data: payload returned by verify_auth_token
+        :return: False for a token of a deleted user with the same login or issued before a password change
+
+        """
+
+        return data.get('id') == self.id and data.get('password') == self.password_fingerprint()
+
+    @staticmethod
+    def verify_auth_token(token: str, expiration: int) -> dict:
+        """Checks the signature and the age of the token
+
+        :param token: token issued by generate_auth_token
+        :param expiration: maximum age of the token in seconds
+        :return: payload of the token {'login', 'id', 'password'} or None
+
+        """
+
+        try:
+            data = token_serializer.loads(token, max_age=expiration)
+        except BadSignature:  # В том числе SignatureExpired
+            return None
+        return data if isinstance(data, dict) and 'login' in data else None
@@ -0,0 +1,135 @@
+"""Serialization of tasks for the responses of the app List of tasks
+
+Tasks are read as plain rows of the needed columns without creating ORM objects and
+encoded with orjson or ujson when one of them is installed, the json module otherwise.
+Exports and imports of tasks use NDJSON or CSV, one task per line.
+"""
+import csv
+import io
+import itertools
+import json
+
+from app.model.models import Task
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# Колонки задачи в ответах API, в порядке ключей to_dict
+TASK_COLUMNS = (Task.deadline, Task.description, Task.done, Task.id, Task.title)
+# Колонки файла CSV при выгрузке и загрузке задач
+CSV_FIELDS = ('id', 'title', 'description', 'deadline', 'done')
+
+if orjson is not None:
+    backend = 'orjson'
+elif ujson is not None:
+    backend = 'ujson'
+else:
+    backend = 'json'
+
+
+def format_deadline(deadline) -> str:
+    """Formats a deadline as yyyy-mm-dd hh:mm, faster than strftime"""
+
+    return deadline.isoformat(' ', 'minutes') if deadline is not None else None
+
+
+def task_row_to_dict(row) -> dict:
+    """Converts a row of TASK_COLUMNS to the same dict as Task.to_dict"""
+
+    deadline, description, done, task_id, title = row
+    return {'deadline': format_deadline(deadline), 'description': description, 'done': done,
+            'id': task_id, 'title': title}
+
+
+def dumps(data) -> bytes:
+    """Encodes data to compact JSON with sorted keys like flask.jsonify
+
+    :param data: json-serializable object
+    :return: UTF-8 encoded JSON
+
+    """
+
+    if backend == 'orjson':
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+    elif backend == 'ujson':
+        return ujson.dumps(data, sort_keys=True, ensure_ascii=False, escape_forward_slashes=False).encode()
+    return json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def loads(data: bytes):
+    """Decodes JSON with the same backend as dumps"""
+
+    if backend == 'orjson':
+        return orjson.loads(data)
+    elif backend == 'ujson':
+        return ujson.loads(data)
+    return json.loads(data)
+
+
+def csv_lines(rows):
+    """Encodes rows of TASK_COLUMNS as CSV with the header CSV_FIELDS
+
+    :param rows: iterator of rows of TASK_COLUMNS
+    :return: generator of UTF-8 encoded lines
+
+    """
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    rows = ((task_id, title, description, format_deadline(deadline), 'true' if done else 'false')
+            for deadline, description, done, task_id, title in rows)
+    for row in itertools.chain([CSV_FIELDS], rows):
+        writer.writerow(row)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def read_ndjson(lines):
+    """Decodes tasks of an NDJSON file line by line
+
+    :param lines: iterator of lines of the file as bytes
+    :return: generator of (line, data): number of the line and the decoded object or None
+             if the line is not valid JSON, empty lines are skipped
+
+    """
+
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, loads(line)
+        except ValueError:
+            yield number, None
+
+
+def read_csv(lines):
+    """Decodes tasks of a CSV file with a header line, e.g. written by csv_lines
+
+    :param lines: iterator of lines of the file as bytes
+    :return: generator of (line, data): number of the last line of the record and a dict of
+             its fields or None if the record can not be decoded
+
+    """
+
+    reader = csv.DictReader(line.decode('utf-8', 'replace') for line in lines)
+    while True:
+        try:
+            data = next(reader)
+        except StopIteration:
+            return
+        except csv.Error:
+            yield reader.line_num, None
+            continue
+        yield reader.line_num, data
+
+
+# Форматы выгрузки и загрузки задач: MIME-тип и функция чтения
+FILE_FORMATS = {'ndjson': ('application/x-ndjson', read_ndjson),
+                'csv': ('text/csv', read_csv)}
@@ -1,22 +1,71 @@
 """Business logic of the app List of tasks
 """
+import json
+import os
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
 from datetime import datetime
+from uuid import uuid4
 
+from sqlalchemy import and_, or_, event, func
 from sqlalchemy.exc import SQLAlchemyError
 
-from app import db
-from app.model.models import Task, User
+from app import app, db, replica_session, recent_writes, credential_cache, tasks_cache, change_notifier, job_executor
+from app.model.models import Task, TaskEvent, User, SchedulerState, Job, INTEGER_RANGE
+from app.model.serializers import TASK_COLUMNS, FILE_FORMATS
+
+IN_CHUNK_SIZE = 900  # Меньше SQLITE_MAX_VARIABLE_NUMBER (999) старых версий SQLite
+
+
+def read_session(login: str):
+    """Chooses the session for reads of the user's data
+
+    Reads go to the replica, if it is configured, except for REPLICA_READ_AFTER_WRITE seconds
+    after the user's own change: the replica may not have it yet.
+
+    :param login: User`s login
+    :return: replica session or db.session
+
+    """
+
+    if replica_session is None or recent_writes.check(login):
+        return db.session
+    return replica_session
+
+
+def _mark_write(login: str):
+    if replica_session is not None:
+        recent_writes.mark(login)
 
 
 def check_login(login: str) -> User:
     """Checking login in the database
 
+    The user may be loaded from the replica, changes go through queries by id on the primary database.
+
     :param login: User`s login
     :return: object User or None
 
     """
 
-    return User.query.filter_by(login=login).first()
+    return read_session(login).query(User).filter_by(login=login).first()
+
+
+def check_token(token: str) -> User:
+    """Checking an access token
+
+    :param token: token issued by the /token endpoint
+    :return: object User or None
+
+    """
+
+    data = User.verify_auth_token(token, app.config['TOKEN_EXPIRATION'])
+    if data is None:
+        return None
+    user = check_login(data['login'])
+    if user is None or not user.check_auth_token(data):  # Пользователь удален или сменил пароль
+        return None
+    return user
 
 
 def create_user(login: str, password: str) -> (int, str, User):
@@ -29,13 +78,14 @@ def create_user(login: str, password: str) -> (int, str, User):
                                   user - object User
 
     """
-    user = check_login(login)
+    user = User.query.filter_by(login=login).first()
     if user is not None:
         return 1, f'this login={login} is busy', user
     user = User(login=login)
     user.set_password(password)
     try:
         db.session.add(user)
+        _mark_write(login)
         db.session.commit()
     except SQLAlchemyError as error:
         db.session.rollback()
@@ -43,6 +93,68 @@ def create_user(login: str, password: str) -> (int, str, User):
     return 0, f'user with login={login} created', user
 
 
+def _record_change(user: User, kind: str, task_ids: list):
+    """Records a change of the user's tasks in the current transaction
+
+    Increments the version of the task list, drops the cached list and writes events
+    for /tasks/changes. Waiting requests are notified after the commit.
+
+    :param user: object User whose tasks were changed
+    :param kind: create, done, delete or reload
+    :param task_ids: ids of the changed tasks
+
+    """
+
+    User.query.filter_by(id=user.id).update({User.tasks_version: User.tasks_version + 1},
+                                            synchronize_session=False)
+    now = datetime.utcnow()
+    db.session.bulk_insert_mappings(TaskEvent, [{'user_id': user.id, 'task_id': task_id, 'kind': kind, 'created': now}
+                                                for task_id in task_ids])
+    tasks_cache.invalidate(user.id, user.login)
+    _mark_write(user.login)
+    db.session.info.setdefault('changed_users', set()).add(user.id)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _notify_changes(session):
+    user_ids = session.info.pop('changed_users', None)
+    if user_ids:
+        change_notifier.notify(user_ids)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_changes(session):
+    session.info.pop('changed_users', None)
+
+
+def validate_task(data: dict) -> (int, str, dict):
+    """Checks the fields of a new task
+
+    :param data: json object with the fields: title, description, and deadline
+    :return: (id, message, fields): id - code [0 - OK, 1 - Data error];
+                                    message - an error message or None
+                                    fields - title, description and deadline converted to DateTime
+
+    """
+
+    if not isinstance(data, dict):
+        return 1, 'the task must be a json object', None
+    for field in ['title', 'description', 'deadline']:
+        if field not in data:
+            return 1, f'the {field} field is missing', None
+    for field in ['title', 'description']:
+        length = Task.__table__.c[field].type.length
+        if not isinstance(data[field], str):
+            return 1, f'the {field} field must be a string', None
+        if len(data[field]) > length:
+            return 1, f'the {field} field is longer than {length} characters', None
+    try:
+        deadline = datetime.strptime(data['deadline'], "%Y-%m-%d %H:%M")  # Из str в форматированный DateTime
+    except (TypeError, ValueError):
+        return 1, 'wrong format deadline (yyyy-mm-dd hh:mm)', None
+    return 0, None, {'title': data['title'], 'description': data['description'], 'deadline': deadline}
+
+
 def create_task(data: dict, user: User) -> (int, str, Task):
     """Creates a task in the database
 
@@ -55,13 +167,14 @@ def create_task(data: dict, user: User) -> (int, str, Task):
     """
 
     task = Task(user_id=user.id, done=False)
-    try:
-        data['deadline'] = datetime.strptime(data['deadline'], "%Y-%m-%d %H:%M")  # Из str в форматированный DateTime
-    except ValueError:
-        return 1, 'wrong format deadline (yyyy-mm-dd hh:mm)', task
-    task.from_dict(data)
+    code, message, fields = validate_task(data)
+    if code:
+        return code, message, task
+    task.from_dict(fields)
     try:
         db.session.add(task)
+        db.session.flush()  # Получить id задачи для события
+        _record_change(user, 'create', [task.id])
         db.session.commit()
     except SQLAlchemyError as error:
         db.session.rollback()
@@ -69,15 +182,214 @@ def create_task(data: dict, user: User) -> (int, str, Task):
     return 0, f'task {task.title} created', task
 
 
-def get_tasks(user: User) -> list:
-    """Gets all the user's tasks
+def create_tasks(items: list, user: User) -> (int, str, int, list):
+    """Creates many tasks in one transaction
+
+    Invalid tasks are skipped, the valid ones are inserted with a single bulk insert.
 
+    :param items: list of json objects with the fields: title, description, and deadline
     :param user: object User
+    :return: (id, message, created, errors): id - code [0 - OK, 1 - Data error, 2 - Database error];
+                                             message - a completion message
+                                             created - number of created tasks
+                                             errors - list of {'index': position in items, 'message': error}
+
+    """
+
+    rows, errors = [], []
+    for index, data in enumerate(items):
+        code, message, fields = validate_task(data)
+        if code:
+            errors.append({'index': index, 'message': message})
+            continue
+        fields.update(user_id=user.id, done=False)
+        rows.append(fields)
+    if not rows:
+        return 1, 'no valid tasks', 0, errors
+    try:
+        _insert_batch(user, rows)
+    except SQLAlchemyError as error:
+        db.session.rollback()
+        return 2, 'failed to create the tasks!', 0, errors
+    return 0, f'{len(rows)} tasks created', len(rows), errors
+
+
+def import_tasks(records, user: User, batch_size: int) -> (int, str, int, list, int):
+    """Creates tasks from a file read record by record, in batched transactions
+
+    Memory does not grow with the size of the file: at most batch_size tasks and
+    IMPORT_ERRORS_LIMIT errors are kept. Every batch is committed with a reload event.
+
+    :param records: iterator of (line, data), see serializers.read_ndjson and serializers.read_csv
+    :param user: object User
+    :param batch_size: number of tasks per transaction
+    :return: (id, message, created, errors, failed): id - code [0 - OK, 1 - Data error, 2 - Database error];
+                                                     message - a completion message
+                                                     created - number of created tasks
+                                                     errors - list of {'line': number, 'message': error}
+                                                     failed - number of invalid records
+
+    """
+
+    created, failed, errors, rows = 0, 0, [], []
+    try:
+        for line, data in records:
+            code, message, fields = validate_task(data) if data is not None else (1, 'wrong format', None)
+            if code:
+                failed += 1
+                if len(errors) < app.config['IMPORT_ERRORS_LIMIT']:
+                    errors.append({'line': line, 'message': message})
+                continue
+            done = data.get('done')
+            fields.update(user_id=user.id, done=done is True or str(done).lower() in ('true', '1'))
+            rows.append(fields)
+            if len(rows) >= batch_size:
+                _insert_batch(user, rows)
+                created += len(rows)
+                rows = []
+        if rows:
+            _insert_batch(user, rows)
+            created += len(rows)
+    except SQLAlchemyError as error:
+        db.session.rollback()
+        return 2, f'failed to import the tasks, {created} tasks created!', created, errors, failed
+    if not created:
+        return 1, 'no valid tasks', 0, errors, failed
+    return 0, f'{created} tasks imported', created, errors, failed
+
+
+def _insert_batch(user: User, rows: list):
+    db.session.bulk_insert_mappings(Task, rows)
+    _record_change(user, 'reload', [None])  # id задач неизвестны после bulk insert
+    db.session.commit()
+
+
+def start_import_tasks(path: str, file_format: str, user: User) -> (int, str, Job):
+    """Imports tasks from a file by a background job, see import_tasks
+
+    :param path: path to the uploaded file, it is deleted by the job
+    :param file_format: ndjson or csv
+    :param user: object User
+    :return: (id, message, job): id - code [2 - Database error, 3 - Accepted];
+                                 message - a completion message
+                                 job - object Job, its result is {"created", "errors", "failed"}
+
+    """
+
+    code, message, job = enqueue_job('import', user.id, _import_tasks_job, path, file_format, user.id)
+    if code == 2:
+        os.remove(path)
+    return code, message, job
+
+
+def _import_tasks_job(path: str, file_format: str, user_id: int) -> (int, str, dict):
+    try:
+        user = User.query.get(user_id)
+        if user is None:
+            return 1, 'the user was deleted', None
+        with open(path, 'rb') as file:
+            _, read = FILE_FORMATS[file_format]
+            code, message, created, errors, failed = import_tasks(read(file), user, app.config['IMPORT_BATCH_SIZE'])
+        return code, message, {'created': created, 'errors': errors, 'failed': failed}
+    finally:
+        os.remove(path)
+
+
+def tasks_query(user: User, limit: int = None, after: (datetime, int) = None, done: bool = None,
+                deadline_from: datetime = None, deadline_to: datetime = None):
+    """Builds a query of the user's tasks ordered by (deadline, id)
+
+    :param user: object User
+    :param limit: maximum number of tasks, all tasks if None
+    :param after: keyset cursor (deadline, id) of the last task of the previous page
+    :param done: only completed (True) or only uncompleted (False) tasks
+    :param deadline_from: only tasks with deadline >= deadline_from
+    :param deadline_to: only tasks with deadline <= deadline_to
+    :return: query of objects Task on the session chosen by read_session
+
+    """
+
+    query = read_session(user.login).query(Task).filter(Task.user_id == user.id)
+    if done is not None:
+        query = query.filter(Task.done == done)
+    if deadline_from is not None:
+        query = query.filter(Task.deadline >= deadline_from)
+    if deadline_to is not None:
+        query = query.filter(Task.deadline <= deadline_to)
+    if after is not None:
+        deadline, task_id = after
+        query = query.filter(or_(Task.deadline > deadline, and_(Task.deadline == deadline, Task.id > task_id)))
+    query = query.order_by(Task.deadline, Task.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def get_tasks(user: User, **filters) -> list:
+    """Gets the user's tasks ordered by (deadline, id)
+
+    The API reads rows with get_task_rows, objects Task are loaded only by the benchmarks
+    as the baseline of serialization and index measurements.
+
+    :param user: object User
+    :param filters: pagination and filters, see tasks_query
     :return: list objects Task
 
     """
 
-    return user.tasks.all()
+    return tasks_query(user, **filters).all()
+
+
+def get_task_rows(user: User, **filters) -> list:
+    """Gets the user's tasks as rows of serializers.TASK_COLUMNS without creating objects Task
+
+    :param user: object User
+    :param filters: pagination and filters, see tasks_query
+    :return: list of rows (deadline, description, done, id, title)
+
+    """
+
+    return tasks_query(user, **filters).with_entities(*TASK_COLUMNS).all()
+
+
+def iter_task_rows(user: User, chunk_size: int, **filters):
+    """Iterates over the user's tasks as rows of serializers.TASK_COLUMNS loaded in chunks
+
+    :param user: object User
+    :param chunk_size: number of rows fetched at a time
+    :param filters: pagination and filters, see tasks_query
+    :return: iterator of rows (deadline, description, done, id, title)
+
+    """
+
+    return tasks_query(user, **filters).with_entities(*TASK_COLUMNS).yield_per(chunk_size)
+
+
+def encode_cursor(task: Task) -> str:
+    """Makes a pagination cursor pointing after the task
+
+    :param task: object Task or a row with deadline and id
+    :return: opaque cursor string
+
+    """
+
+    return urlsafe_b64encode(f'{task.deadline:%Y-%m-%d %H:%M:%S}|{task.id}'.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> (datetime, int):
+    """Parses a cursor made by encode_cursor
+
+    :param cursor: opaque cursor string
+    :return: (deadline, id) of the task or None if the cursor is invalid
+
+    """
+
+    try:
+        deadline, task_id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+        deadline, task_id = datetime.strptime(deadline, "%Y-%m-%d %H:%M:%S"), int(task_id)
+    except (DecodeError, UnicodeDecodeError, ValueError):
+        return None
+    return (deadline, task_id) if task_id in INTEGER_RANGE else None
 
 
 def get_task(user: User, task_id: int) -> Task:
@@ -89,7 +401,123 @@ def get_task(user: User, task_id: int) -> Task:
 
     """
 
-    return user.tasks.filter_by(id=task_id).first()
+    return read_session(user.login).query(Task).filter_by(user_id=user.id, id=task_id).first()
+
+
+def last_change(user_id: int) -> int:
+    """Gets the cursor of the user's change feed
+
+    :param user_id: id of the user
+    :return: id of the last event or 0
+
+    """
+
+    last = db.session.query(func.max(TaskEvent.id)).filter(TaskEvent.user_id == user_id).scalar() or 0
+    return max(last, _pruned_events())  # Курсор не старше удаленных событий, иначе get_changes вернет reload
+
+
+def get_changes(user_id: int, since: int, limit: int) -> (list, dict):
+    """Gets the events of the user's tasks after the cursor
+
+    :param user_id: id of the user
+    :param since: cursor, id of the last event seen by the client
+    :param limit: maximum number of events
+    :return: (events, tasks): list objects TaskEvent, starts with a reload event if the cursor
+                              is older than the pruned events;
+                              current objects Task of create, done and due events by id
+
+    """
+
+    events = TaskEvent.query.filter(TaskEvent.user_id == user_id, TaskEvent.id > since) \
+        .order_by(TaskEvent.id).limit(limit).all()
+    pruned = _pruned_events()
+    if since < pruned:  # События после курсора могли быть удалены, клиент должен перечитать список
+        events.insert(0, TaskEvent(id=pruned, user_id=user_id, kind='reload'))
+    ids = {event.task_id for event in events if event.kind in ('create', 'done', 'due')}
+    tasks = {}
+    for chunk in _chunks(sorted(ids)):
+        tasks.update((task.id, task) for task in Task.query.filter(Task.user_id == user_id, Task.id.in_(chunk)))
+    return events, tasks
+
+
+def notify_due_tasks(now: datetime, batch_size: int) -> (int, str, int):
+    """Writes due events for uncompleted tasks whose deadline has come
+
+    Tasks are scanned in batches by the index (done, deadline) from the cursor (deadline, id)
+    saved by the previous run, so every task is notified once and done tasks are never read.
+    Every batch is committed with the new cursor.
+
+    :param now: current time, tasks with deadline <= now are due
+    :param batch_size: number of tasks per transaction
+    :return: (id, message, notified): id - code [0 - OK, 2 - Database error];
+                                      message - a completion message
+                                      notified - number of written events
+
+    """
+
+    notified = 0
+    try:
+        state = SchedulerState.query.get('due_tasks') or SchedulerState(name='due_tasks')
+        after = decode_cursor(state.value) if state.value else None
+        while True:
+            query = Task.query.filter(Task.done == db.false(), Task.deadline <= now)
+            if after is not None:
+                query = query.filter(or_(Task.deadline > after[0], and_(Task.deadline == after[0], Task.id > after[1])))
+            rows = query.with_entities(Task.deadline, Task.id, Task.user_id) \
+                .order_by(Task.deadline, Task.id).limit(batch_size).all()
+            if not rows:
+                break
+            created = datetime.utcnow()
+            db.session.bulk_insert_mappings(TaskEvent, [{'user_id': row.user_id, 'task_id': row.id, 'kind': 'due',
+                                                         'created': created} for row in rows])
+            db.session.info.setdefault('changed_users', set()).update(row.user_id for row in rows)
+            after = (rows[-1].deadline, rows[-1].id)
+            state.value = encode_cursor(rows[-1])
+            db.session.add(state)
+            db.session.commit()
+            notified += len(rows)
+    except SQLAlchemyError as error:
+        db.session.rollback()
+        return 2, 'failed to notify due tasks!', notified
+    return 0, f'{notified} due tasks notified', notified
+
+
+def prune_events(before: datetime, batch_size: int) -> (int, str, int):
+    """Deletes events of the change feed created before the time
+
+    Events are deleted in batches in the order of id, every batch is committed with the id of
+    the last deleted event: get_changes answers older cursors with a reload event.
+
+    :param before: events created earlier are deleted, UTC
+    :param batch_size: number of events per transaction
+    :return: (id, message, deleted): id - code [0 - OK, 2 - Database error];
+                                     message - a completion message
+                                     deleted - number of deleted events
+
+    """
+
+    deleted = 0
+    try:
+        state = SchedulerState.query.get('pruned_events') or SchedulerState(name='pruned_events', value='0')
+        while True:
+            ids = [row.id for row in TaskEvent.query.with_entities(TaskEvent.id).filter(TaskEvent.created < before)
+                   .order_by(TaskEvent.id).limit(batch_size)]
+            if not ids:
+                break
+            TaskEvent.query.filter(TaskEvent.id.in_(ids)).delete(synchronize_session=False)
+            state.value = str(max(int(state.value), ids[-1]))
+            db.session.add(state)
+            db.session.commit()
+            deleted += len(ids)
+    except SQLAlchemyError as error:
+        db.session.rollback()
+        return 2, 'failed to prune events!', deleted
+    return 0, f'{deleted} events pruned', deleted
+
+
+def _pruned_events() -> int:
+    state = SchedulerState.query.get('pruned_events')
+    return int(state.value) if state is not None else 0
 
 
 def done_task(user: User, task_id: int) -> (int, str, Task):
@@ -102,11 +530,12 @@ def done_task(user: User, task_id: int) -> (int, str, Task):
 
     """
 
-    task = user.tasks.filter_by(id=task_id).first()
+    task = Task.query.filter_by(user_id=user.id, id=task_id).first()  # Основная база, не сессия user
     if task is None:
         return 1, f'the task with id={task_id} doesn`t exist', task
     task.done = True
     try:
+        _record_change(user, 'done', [task_id])
         db.session.commit()
     except SQLAlchemyError as error:
         db.session.rollback()
@@ -114,43 +543,250 @@ def done_task(user: User, task_id: int) -> (int, str, Task):
     return 0, f'the task with id={task_id} is marked as completed', task
 
 
-def delete_user(login: str)-> (int, str):
-    """Deletes a user
+def _chunks(ids: list):
+    """Splits ids into lists small enough for one IN (...) clause"""
+
+    for start in range(0, len(ids), IN_CHUNK_SIZE):
+        yield ids[start:start + IN_CHUNK_SIZE]
 
-    :param login:  user login
-    :return: (id, message): id - code [0 - OK, 1 - Data error, 2 - Database error];
-                            message - a completion message
+
+def done_tasks(user: User, ids: list) -> (int, str, list):
+    """Marks many tasks as completed with set-based UPDATE statements
+
+    :param user: object User
+    :param ids: ids of tasks
+    :return: (id, message, matched): id - code [0 - OK, 2 - Database error];
+                                     message - a completion message
+                                     matched - ids of the user's tasks that were marked
 
     """
-    user = check_login(login)
+
+    matched = []
+    try:
+        for chunk in _chunks(sorted(set(ids))):
+            query = Task.query.filter(Task.user_id == user.id, Task.id.in_(chunk))
+            found = [row.id for row in query.with_entities(Task.id)]
+            if found:
+                query.update({Task.done: True}, synchronize_session=False)
+                matched += found
+        if matched:
+            _record_change(user, 'done', matched)
+        db.session.commit()
+    except SQLAlchemyError as error:
+        db.session.rollback()
+        return 2, 'failed to mark the tasks as completed!', []
+    return 0, f'{len(matched)} tasks are marked as completed', matched
+
+
+def delete_tasks(user: User, ids: list) -> (int, str, list):
+    """Deletes many tasks with set-based DELETE statements
+
+    :param user: object User
+    :param ids: ids of tasks
+    :return: (id, message, matched): id - code [0 - OK, 2 - Database error];
+                                     message - a completion message
+                                     matched - ids of the user's tasks that were deleted
+
+    """
+
+    matched = []
+    try:
+        for chunk in _chunks(sorted(set(ids))):
+            query = Task.query.filter(Task.user_id == user.id, Task.id.in_(chunk))
+            found = [row.id for row in query.with_entities(Task.id)]
+            if found:
+                query.delete(synchronize_session=False)
+                matched += found
+        if matched:
+            _record_change(user, 'delete', matched)
+        db.session.commit()
+    except SQLAlchemyError as error:
+        db.session.rollback()
+        return 2, 'failed to delete the tasks!', []
+    return 0, f'{len(matched)} tasks were deleted', matched
+
+
+def delete_user(user: User) -> (int, str, Job):
+    """Deletes a user with set-based DELETE statements
+
+    A user with more than DELETE_USER_ASYNC_THRESHOLD tasks is deleted by a background job.
+
+    :param user: object User
+    :return: (id, message, job): id - code [0 - OK, 2 - Database error,
+                                            3 - Accepted, the deletion continues in the background];
+                                 message - a completion message
+                                 job - object Job of the background deletion or None
+
+    """
+
+    user_id, login = user.id, user.login
+    threshold = app.config['DELETE_USER_ASYNC_THRESHOLD']
+    credential_cache.invalidate(login)
+    tasks_cache.invalidate(user_id, login)
+    _mark_write(login)
+    if db.session.query(Task.id).filter_by(user_id=user_id).limit(threshold + 1).count() > threshold:
+        code, message, job = enqueue_job('delete_user', user_id, _delete_user_job, user_id, login)
+        return code, f'user {login} is being deleted' if code == 3 else message, job
+    try:
+        _delete_user_rows(user_id)
+        db.session.commit()
+    except SQLAlchemyError as error:
+        db.session.rollback()
+        return 2, 'failed to delete the user!', None
+    return 0, f'user {login} was deleted', None
+
+
+def _delete_user_rows(user_id: int):
+    Task.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+    TaskEvent.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+    User.query.filter_by(id=user_id).delete(synchronize_session=False)
+
+
+def _delete_user_job(user_id: int, login: str) -> (int, str, dict):
+    """Deletes the tasks of the user in short transactions, then the user itself"""
+
+    while True:
+        ids = [row.id for row in db.session.query(Task.id).filter_by(user_id=user_id).limit(IN_CHUNK_SIZE)]
+        if len(ids) < IN_CHUNK_SIZE:
+            break
+        Task.query.filter(Task.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+    _delete_user_rows(user_id)  # Оставшиеся задачи удаляются вместе с пользователем
+    _mark_write(login)
+    db.session.commit()
+    return 0, f'user {login} was deleted', None
+
+
+def start_create_tasks(items: list, user: User) -> (int, str, Job):
+    """Creates many tasks by a background job, see create_tasks
+
+    :param items: list of json objects with the fields: title, description, and deadline
+    :param user: object User
+    :return: (id, message, job): id - code [2 - Database error, 3 - Accepted];
+                                 message - a completion message
+                                 job - object Job, its result is {"created": number, "errors": [...]}
+
+    """
+
+    return enqueue_job('create_tasks', user.id, _create_tasks_job, items, user.id)
+
+
+def _create_tasks_job(items: list, user_id: int) -> (int, str, dict):
+    user = User.query.get(user_id)
     if user is None:
-        return 1, f'user {login} was not found'
-    tasks_user = Task.query.filter_by(user_id=user.id).all()
+        return 1, 'the user was deleted', None
+    code, message, created, errors = create_tasks(items, user)
+    return code, message, {'created': created, 'errors': errors}
+
+
+def enqueue_job(kind: str, user_id: int, function, *args) -> (int, str, Job):
+    """Saves a job in the database and runs it in the background
+
+    :param kind: type of the job, e.g. delete_user
+    :param user_id: id of the user who started the job
+    :param function: called with args in an app context, returns (id, message, result) where
+                     result is a json-serializable object or None
+    :return: (id, message, job): id - code [2 - Database error, 3 - Accepted];
+                                 message - a completion message
+                                 job - object Job
+
+    """
+
+    job = Job(id=uuid4().hex, user_id=user_id, kind=kind, status='queued')
     try:
-        for task in tasks_user:
-            db.session.delete(task)
-        db.session.delete(user)
+        db.session.add(job)
         db.session.commit()
     except SQLAlchemyError as error:
         db.session.rollback()
-        return 2, 'failed to delete the user!'
-    return 0, f'user {login} was deleted'
+        return 2, f'failed to start the job {kind}!', job
+    job_executor.submit(_run_job, job.id, function, args)
+    return 3, f'job {kind} accepted', job
+
+
+def _run_job(job_id: str, function, args: tuple):
+    with app.app_context():
+        try:
+            Job.query.filter_by(id=job_id).update({Job.status: 'running'}, synchronize_session=False)
+            db.session.commit()
+            code, message, result = function(*args)
+        except Exception as error:  # Задание не должно навсегда остаться в статусе running
+            db.session.rollback()
+            app.logger.exception(f'job {job_id} failed')
+            code, message, result = 2, 'the job failed!', None
+        try:
+            Job.query.filter_by(id=job_id).update({Job.status: 'failed' if code else 'done',
+                                                   Job.message: message[:256],
+                                                   Job.result: json.dumps(result) if result is not None else None,
+                                                   Job.finished: datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+        except SQLAlchemyError as error:
+            db.session.rollback()
+            app.logger.error(f'failed to save the state of the job {job_id}: {error}')
+        finally:
+            db.session.remove()
+
+
+def recover_jobs(before: datetime) -> (int, str, int):
+    """Finishes jobs lost by a restart of the process that ran them
+
+    Jobs live only in the pool of their process. A queued or running job created before the time
+    is considered lost: the deletion of a user is completed here, other jobs are marked failed.
+
+    :param before: jobs created earlier are lost, UTC
+    :return: (id, message, recovered): id - code [0 - OK, 2 - Database error];
+                                       message - a completion message
+                                       recovered - number of finished jobs
 
+    """
+
+    recovered = 0
+    try:
+        for job in Job.query.filter(Job.status.in_(('queued', 'running')), Job.created < before).all():
+            if job.kind == 'delete_user':  # Клиент получил 202, пользователь должен быть удален
+                user = User.query.get(job.user_id)
+                code, message, result = _delete_user_job(user.id, user.login) if user is not None else \
+                    (0, 'the user was deleted', None)
+            else:
+                code, message, result = 2, 'the job was lost by a restart of the server!', None
+            job.status = 'failed' if code else 'done'
+            job.message = message[:256]
+            job.result = json.dumps(result) if result is not None else None
+            job.finished = datetime.utcnow()
+            db.session.commit()
+            recovered += 1
+    except SQLAlchemyError as error:
+        db.session.rollback()
+        return 2, f'failed to recover the jobs, {recovered} jobs recovered!', recovered
+    return 0, f'{recovered} lost jobs recovered', recovered
+
+
+def get_job(job_id: str) -> Job:
+    """Gets a job by id
 
-def delete_task(task_id: int) -> (int, str):
+    :param job_id: id of the job
+    :return: object Job or None
+
+    """
+
+    return Job.query.get(job_id)
+
+
+def delete_task(user: User, task_id: int) -> (int, str):
     """Deletes an task
 
+    :param user: object User
     :param task_id:  id a task
     :return: (id, message): id - code [0 - OK, 1 - Data error, 2 - Database error];
                             message - a completion message
 
     """
 
-    task = Task.query.get(task_id)
+    task = Task.query.filter_by(user_id=user.id, id=task_id).first()  # Основная база, не сессия user
     if task is None:
         return 1, f'task {task_id} was not found'
     try:
         db.session.delete(task)
+        _record_change(user, 'delete', [task_id])
         db.session.commit()
     except SQLAlchemyError as error:
         db.session.rollback()
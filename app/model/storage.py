@@ -0,0 +1,109 @@
+"""Storage profiles of the app List of tasks
+
+A profile is a set of SQLAlchemy engine options and SQLite pragmas selected by STORAGE_PROFILE.
+An optional read-only replica of the database gets its own engine and session.
+"""
+import sqlite3
+
+from flask import _app_ctx_stack
+from sqlalchemy import event, create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+PROFILES = {
+    # Настройки SQLite и Flask-SQLAlchemy по умолчанию
+    'default': {
+        'engine_options': {},
+        'pragmas': {},
+    },
+    # Несколько воркеров gunicorn на одном файле базы: читатели не блокируют писателя,
+    # писатели ждут блокировку вместо ошибки database is locked
+    'sqlite-wal': {
+        'engine_options': {
+            'poolclass': QueuePool,
+            'pool_size': 5,
+            'max_overflow': 10,
+            'pool_timeout': 30,
+            'connect_args': {'timeout': 30, 'check_same_thread': False},
+        },
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 30000,
+            'mmap_size': 268435456,
+            'temp_store': 'MEMORY',
+        },
+    },
+}
+
+
+def sqlite_pragmas_listener(pragmas: dict):
+    """Makes a connect event listener that executes PRAGMA statements on new SQLite connections
+
+    :param pragmas: pragma name -> value
+    :return: listener for the 'connect' event of an Engine
+
+    """
+
+    def set_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+    return set_pragmas
+
+
+def configure_storage(app):
+    """Applies the profile STORAGE_PROFILE to the config of the app
+
+    Must be called before the first connection to the database.
+
+    :param app: object Flask
+
+    """
+
+    profile = PROFILES[app.config['STORAGE_PROFILE']]
+    options = dict(profile['engine_options'], **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def configure_engine(db, app):
+    """Applies the SQLite pragmas of the profile STORAGE_PROFILE to the primary engine of the app
+
+    Other engines, e.g. of the replica, keep the defaults of SQLite. Must be called before
+    the first connection to the database.
+
+    :param db: object SQLAlchemy of the app
+    :param app: object Flask, configured by configure_storage
+
+    """
+
+    pragmas = PROFILES[app.config['STORAGE_PROFILE']]['pragmas']
+    if pragmas:
+        event.listen(db.get_engine(app), 'connect', sqlite_pragmas_listener(pragmas))
+
+
+def create_replica_session(app):
+    """Creates a session of the read-only replica REPLICA_DATABASE_URI
+
+    The session is scoped like db.session and removed at the end of the app context.
+
+    :param app: object Flask, configured by configure_storage
+    :return: scoped session or None if no replica is configured
+
+    """
+
+    uri = app.config['REPLICA_DATABASE_URI']
+    if not uri:
+        return None
+    engine = create_engine(uri, **app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+    session = scoped_session(sessionmaker(bind=engine), scopefunc=_app_ctx_stack.__ident_func__)
+
+    @app.teardown_appcontext
+    def remove_replica_session(exception):
+        session.remove()
+
+    return session
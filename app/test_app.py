@@ -1,8 +1,106 @@
+import asyncio
+import glob
+import gzip
+import os
+import tempfile
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Timer
+from time import sleep, monotonic
+from uuid import uuid4
+from datetime import datetime, timedelta
 from json import dumps, loads
-from base64 import b64encode
+from base64 import b64encode, urlsafe_b64encode
 
-from app import app
+from flask import Flask, jsonify, g
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, create_engine
+from werkzeug.exceptions import ClientDisconnected
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from app import app, db, credential_cache, tasks_cache, rate_limiter, job_executor, change_waiters, change_notifier
+from app.asgi import application, WSGIApplication
+from app.model.cache import CredentialCache, LRUCache, RecentWrites
+from app.model.storage import PROFILES, sqlite_pragmas_listener, configure_storage, configure_engine, \
+    create_replica_session
+from app.model.events import ChangeNotifier
+from app.model.limits import MemoryBucketStore, SingleFlight, parse_limits
+from app.model.models import Task, SchedulerState, User, Job
+import app.model.services as service
+import app.model.serializers as serializers
+import app.controller.encoding as encoding
+import app.controller.metrics as metrics
+
+
+class ASGIClient(object):
+    """Sends requests to the ASGI application, has the interface of the Flask test client used here"""
+
+    def __init__(self, asgi_app):
+        self.asgi_app = asgi_app
+
+    def open(self, method: str, url: str, headers: dict = None, data: str = '', content_type: str = None) -> object:
+        return asyncio.run(self.request(method, url, headers, data, content_type))
+
+    async def request(self, method: str, url: str, headers: dict = None, data: str = '',
+                      content_type: str = None) -> object:
+        path, _, query = url.partition('?')
+        headers = dict(headers or {})
+        body = data.encode() if isinstance(data, str) else data
+        if content_type:
+            headers['Content-Type'] = content_type
+        headers['Content-Length'] = str(len(body))
+        scope = {'type': 'http', 'method': method.upper(), 'path': path, 'query_string': query.encode(),
+                 'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()]}
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        sent = []
+
+        async def receive():
+            if not messages:  # Клиент отключается после ответа
+                while not sent or sent[-1].get('more_body', True):
+                    await asyncio.sleep(0.01)
+                return {'type': 'http.disconnect'}
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await self.asgi_app(scope, receive, send)
+        start = sent[0]
+        return app.response_class(b''.join(message.get('body', b'') for message in sent[1:]), status=start['status'],
+                                  headers=[(name.decode(), value.decode()) for name, value in start['headers']])
+
+    def get(self, url: str, **kwargs) -> object:
+        return self.open('get', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> object:
+        return self.open('post', url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> object:
+        return self.open('put', url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> object:
+        return self.open('delete', url, **kwargs)
+
+
+class BrokenStream(object):
+    """Body of a request whose client disconnects during the upload"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.position = 0
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        self.position = self.size + offset if whence == 2 else offset
+        return self.position
+
+    def read(self, size: int = -1) -> bytes:
+        raise ClientDisconnected()
+
+    readline = read
 
 
 class TestRoutes(unittest.TestCase):
@@ -12,6 +110,7 @@ class TestRoutes(unittest.TestCase):
         self.auth = {
             'Authorization': 'Basic ' + b64encode(f"{self.user['login']}:{self.user['password']}".encode()).decode()}
         self.app.post('/create_user', data=dumps(self.user), content_type='application/json')
+        rate_limiter.clear()
 
     def tearDown(self) -> None:
         self.app.delete('/delete_user', headers=self.auth)
@@ -27,6 +126,9 @@ class TestRoutes(unittest.TestCase):
         index_page = self.app.get('/')
         self.assertEqual(index_page.status_code, 200, 'index - wrong status code')
         self.assertIn(f'List of tasks', index_page.data.decode('UTF-8'))
+        # Страница не менялась - ответ 304 по ETag
+        index_page = self.app.get('/', headers={'If-None-Match': index_page.headers['ETag']})
+        self.assertEqual(index_page.status_code, 304, 'index - wrong status code')
 
     def test_create_user(self):
         # Если никаких данных переданно не было
@@ -70,6 +172,113 @@ class TestRoutes(unittest.TestCase):
         self.assertEqual(delete_user.status_code, 200, 'delete_user - wrong status code')
         self.assertEqual(json_answer['message'], f'user {user["login"]} was deleted', 'delete_user - wrong json answer')
 
+    def test_delete_user_in_background(self):
+        user = {'login': 'heavy_user', 'password': 'pass'}
+        headers = {'Authorization': 'Basic ' + b64encode(f"{user['login']}:{user['password']}".encode()).decode()}
+        self.app.post('/create_user', data=dumps(user), content_type='application/json')
+        tasks = [{'title': f'task {i}', 'description': 'test description', 'deadline': '2020-03-13 10:00'}
+                 for i in range(3)]
+        self.app.post('/create_tasks', headers=headers, data=dumps(tasks), content_type='application/json')
+        threshold = app.config['DELETE_USER_ASYNC_THRESHOLD']
+        app.config['DELETE_USER_ASYNC_THRESHOLD'] = 2
+        try:
+            delete_user = self.app.delete('/delete_user', headers=headers)
+        finally:
+            app.config['DELETE_USER_ASYNC_THRESHOLD'] = threshold
+        self.assertEqual(delete_user.status_code, 202, 'delete_user - wrong status code')
+        job = loads(delete_user.data)['job']
+        self.assertEqual(delete_user.headers['Location'].rsplit('/', 1)[-1], job['id'], 'delete_user - wrong Location')
+        # Пользователь исчезает после завершения фонового задания
+        job_executor.wait(10)
+        get_job = self.app.get(f'/jobs/{job["id"]}')
+        self.assertEqual(loads(get_job.data)['status'], 'done', 'delete_user - job was not done')
+        self.assertEqual(self.app.get('/tasks', headers=headers).status_code, 401, 'delete_user - user was not deleted')
+
+    def test_create_tasks_in_background(self):
+        tasks = [{'title': f'task {i}', 'description': 'test description', 'deadline': '2020-03-13 10:00'}
+                 for i in range(3)] + [{'title': 'wrong'}]
+        threshold = app.config['BULK_TASKS_ASYNC_THRESHOLD']
+        app.config['BULK_TASKS_ASYNC_THRESHOLD'] = 2
+        try:
+            create_tasks = self.app.post('/create_tasks', headers=self.auth, data=dumps(tasks),
+                                         content_type='application/json')
+        finally:
+            app.config['BULK_TASKS_ASYNC_THRESHOLD'] = threshold
+        self.assertEqual(create_tasks.status_code, 202, 'create_tasks in background - wrong status code')
+        job = loads(create_tasks.data)['job']
+        self.assertIn(job['status'], ('queued', 'running', 'done'), 'create_tasks in background - wrong status')
+        job_executor.wait(10)
+        job = loads(self.app.get(f'/jobs/{job["id"]}').data)
+        self.assertEqual((job['status'], job['result']['created'], len(job['result']['errors'])), ('done', 3, 1),
+                         'create_tasks in background - wrong job')
+        self.assertEqual(len(loads(self.app.get('/tasks', headers=self.auth).data)['tasks']), 3,
+                         'create_tasks in background - tasks were not created')
+        self.assertEqual(self.app.get('/jobs/unknown').status_code, 404, 'jobs - wrong status code')
+
+    def test_export_import(self):
+        tasks = [{'title': f'task {i}', 'description': 'test, "description"', 'deadline': '2020-03-13 10:00'}
+                 for i in range(3)]
+        self.app.post('/create_tasks', headers=self.auth, data=dumps(tasks), content_type='application/json')
+        task_id = loads(self.app.get('/tasks', headers=self.auth).data)['tasks'][0]['id']
+        self.app.put(f'/done/{task_id}', headers=self.auth)
+        export = self.app.get('/export', headers=self.auth)
+        self.assertEqual(export.mimetype, 'application/x-ndjson', 'export - wrong content type')
+        exported = [loads(line) for line in export.data.decode().splitlines()]
+        self.assertEqual([task['done'] for task in exported], [True, False, False], 'export - wrong ndjson')
+        export_csv = self.app.get('/export?format=csv', headers=self.auth)
+        self.assertEqual(export_csv.data.decode().splitlines()[:2],
+                         ['id,title,description,deadline,done',
+                          f'{task_id},task 0,"test, ""description""",2020-03-13 10:00,true'], 'export - wrong csv')
+        self.assertEqual(self.app.get('/export?format=xml', headers=self.auth).status_code, 400,
+                         'export - wrong status code')
+        # Выгруженный CSV загружается обратно, невалидные строки пропускаются
+        import_csv = self.app.post('/import', headers=self.auth, data=export_csv.data, content_type='text/csv')
+        self.assertEqual(import_csv.status_code, 201, 'import - wrong status code')
+        self.assertEqual(loads(import_csv.data)['created'], 3, 'import - wrong json answer')
+        body = export.data + b'not json\n' + dumps({'title': 'task'}).encode() + b'\n'
+        import_ndjson = self.app.post('/import', headers=self.auth, data=body, content_type='application/x-ndjson')
+        json_answer = loads(import_ndjson.data)
+        self.assertEqual((json_answer['created'], json_answer['failed']), (3, 2), 'import - wrong json answer')
+        self.assertEqual([error['line'] for error in json_answer['errors']], [4, 5], 'import - wrong errors')
+        get_tasks = loads(self.app.get('/tasks?done=true', headers=self.auth).data)
+        self.assertEqual(len(get_tasks['tasks']), 3, 'import - done was not imported')
+        # Записи с неверными типами полей не отменяют загрузку остальных записей пакета
+        body = (dumps({'title': 1, 'description': 'test description', 'deadline': '2020-03-13 10:00'}) + '\n' +
+                dumps({'title': 't' * 65, 'description': 'test description', 'deadline': '2020-03-13 10:00'}) + '\n' +
+                dumps([]) + '\n' + export.data.decode())
+        import_ndjson = self.app.post('/import', headers=self.auth, data=body, content_type='application/x-ndjson')
+        json_answer = loads(import_ndjson.data)
+        self.assertEqual(import_ndjson.status_code, 201, 'import - wrong status code')
+        self.assertEqual((json_answer['created'], json_answer['failed']), (3, 3), 'import - wrong json answer')
+        import_csv = self.app.post('/import', headers=self.auth, data=export_csv.data + b'1,short row\n',
+                                   content_type='text/csv')
+        self.assertEqual((loads(import_csv.data)['created'], loads(import_csv.data)['failed']), (3, 1),
+                         'import - wrong json answer')
+        # Большой файл загружается фоновым заданием
+        size = app.config['IMPORT_ASYNC_SIZE']
+        app.config['IMPORT_ASYNC_SIZE'] = 10
+        try:
+            import_job = self.app.post('/import', headers=self.auth, data=export.data,
+                                       content_type='application/x-ndjson')
+        finally:
+            app.config['IMPORT_ASYNC_SIZE'] = size
+        self.assertEqual(import_job.status_code, 202, 'import - wrong status code')
+        job_executor.wait(10)
+        job = loads(self.app.get(f'/jobs/{loads(import_job.data)["job"]["id"]}').data)
+        self.assertEqual((job['status'], job['result']['created']), ('done', 3), 'import - wrong job')
+        self.assertEqual(len(loads(self.app.get('/tasks', headers=self.auth).data)['tasks']), 18,
+                         'import - tasks were not created')
+        # Временный файл удаляется, если загрузка прервалась
+        files = set(glob.glob(os.path.join(tempfile.gettempdir(), 'list-tasks-import-*')))
+        import_broken = app.test_client().post('/import', headers=self.auth,
+                                               input_stream=BrokenStream(app.config['IMPORT_ASYNC_SIZE'] + 1),
+                                               content_type='application/x-ndjson')
+        self.assertEqual(import_broken.status_code, 400, 'import - wrong status code')
+        self.assertEqual(set(glob.glob(os.path.join(tempfile.gettempdir(), 'list-tasks-import-*'))), files,
+                         'import - temporary file was left')
+        import_json = self.app.post('/import', headers=self.auth, data=export.data, content_type='application/json')
+        self.assertEqual(import_json.status_code, 400, 'import - wrong status code')
+
     def test_create_task(self):
         # Поля для создания задачи пустые
         task = {}
@@ -125,6 +334,37 @@ class TestRoutes(unittest.TestCase):
                          'create_task - wrong json answer [message]')
         self.assertEqual(create_task.status_code, 400, 'create_task - wrong status code')
 
+    def test_create_tasks(self):
+        # Передан не массив
+        create_tasks = self.app.post('/create_tasks', headers=self.auth, data=dumps({'title': 'test task'}),
+                                     content_type='application/json')
+        self.assertEqual(create_tasks.status_code, 400, 'create_tasks - wrong status code')
+        # Ошибки отдельных задач не мешают созданию остальных
+        tasks = [{'title': 'task 1', 'description': 'description 1', 'deadline': '2020-03-13 10:00'},
+                 {'title': 'task 2', 'description': 'description 2'},
+                 {'title': 'task 3', 'description': 'description 3', 'deadline': '13.03.2020'},
+                 {'title': 'task 4', 'description': 'description 4', 'deadline': '2020-03-14 10:00'},
+                 {'title': ['task 5'], 'description': 'description 5', 'deadline': '2020-03-14 10:00'},
+                 {'title': 'task 6', 'description': 'd' * 257, 'deadline': '2020-03-14 10:00'}]
+        create_tasks = self.app.post('/create_tasks', headers=self.auth, data=dumps(tasks),
+                                     content_type='application/json')
+        json_answer = loads(create_tasks.data)
+        self.assertEqual(create_tasks.status_code, 201, 'create_tasks - wrong status code')
+        self.assertEqual(json_answer['created'], 2, 'create_tasks - wrong json answer [created]')
+        self.assertEqual(json_answer['errors'], [{'index': 1, 'message': 'the deadline field is missing'},
+                                                 {'index': 2, 'message': 'wrong format deadline (yyyy-mm-dd hh:mm)'},
+                                                 {'index': 4, 'message': 'the title field must be a string'},
+                                                 {'index': 5,
+                                                  'message': 'the description field is longer than 256 characters'}],
+                         'create_tasks - wrong json answer [errors]')
+        json_answer = loads(self.app.get('/tasks', headers=self.auth).data)
+        self.assertEqual([task['title'] for task in json_answer['tasks']], ['task 1', 'task 4'],
+                         'create_tasks - tasks were not created')
+        # Все задачи невалидны
+        create_tasks = self.app.post('/create_tasks', headers=self.auth, data=dumps(tasks[1:3]),
+                                     content_type='application/json')
+        self.assertEqual(create_tasks.status_code, 400, 'create_tasks - wrong status code')
+
     def test_get_tasks(self):
         # Если список еще пуст
         get_tasks = self.app.get('/tasks', headers=self.auth)
@@ -141,6 +381,249 @@ class TestRoutes(unittest.TestCase):
         self.assertEqual(list(json_answer['tasks'][0].keys()), ['deadline', 'description', 'done', 'id', 'title'],
                          'get_tasks - wrong json answer')
 
+    def test_get_tasks_pagination(self):
+        for i, deadline in enumerate(['2020-03-15 10:00', '2020-03-13 10:00', '2020-03-14 10:00', '2020-03-13 10:00']):
+            task = {'title': f'task {i}', 'description': 'test description', 'deadline': deadline}
+            self.app.post('/create_task', headers=self.auth, data=dumps(task), content_type='application/json')
+        self.app.put(f'/done/{loads(self.app.get("/tasks", headers=self.auth).data)["tasks"][0]["id"]}',
+                     headers=self.auth)
+        # Постраничный обход в порядке (deadline, id)
+        titles, url = [], '/tasks?limit=3'
+        while url:
+            json_answer = loads(self.app.get(url, headers=self.auth).data)
+            titles += [task['title'] for task in json_answer['tasks']]
+            url = f'/tasks?limit=3&after={json_answer["next"]}' if json_answer['next'] else None
+        self.assertEqual(titles, ['task 1', 'task 3', 'task 2', 'task 0'], 'get_tasks - wrong pagination')
+        # Фильтры
+        json_answer = loads(self.app.get('/tasks?done=false&deadline_from=2020-03-13 12:00', headers=self.auth).data)
+        self.assertEqual([task['title'] for task in json_answer['tasks']], ['task 2', 'task 0'],
+                         'get_tasks - wrong filters')
+        json_answer = loads(self.app.get('/tasks?done=true', headers=self.auth).data)
+        self.assertEqual([task['title'] for task in json_answer['tasks']], ['task 1'], 'get_tasks - wrong filters')
+        # Невалидные параметры
+        big_id = urlsafe_b64encode(f'2020-03-13 10:00:00|{10 ** 22}'.encode()).decode()  # id больше 64 бит
+        for query in ('limit=a', 'limit=0', 'after=xyz', f'after={big_id}', 'done=maybe', 'deadline_to=13.03.2020'):
+            get_tasks = self.app.get(f'/tasks?{query}', headers=self.auth)
+            self.assertEqual(get_tasks.status_code, 400, f'get_tasks - wrong status code for {query}')
+
+    def test_get_tasks_stream(self):
+        for i in range(3):
+            task = {'title': f'task {i}', 'description': 'test description', 'deadline': '2020-03-13 10:00'}
+            self.app.post('/create_task', headers=self.auth, data=dumps(task), content_type='application/json')
+        tasks = loads(self.app.get('/tasks', headers=self.auth).data)['tasks']
+        # Потоковая выдача в том же формате
+        get_tasks = self.app.get('/tasks?stream=1', headers=self.auth)
+        self.assertEqual(get_tasks.status_code, 200, 'get_tasks stream - wrong status code')
+        self.assertEqual(loads(get_tasks.data)['tasks'], tasks, 'get_tasks stream - wrong json answer')
+        # NDJSON - одна задача в строке
+        get_tasks = self.app.get('/tasks?done=false', headers=dict(self.auth, Accept='application/x-ndjson'))
+        self.assertEqual(get_tasks.mimetype, 'application/x-ndjson', 'get_tasks ndjson - wrong mimetype')
+        self.assertEqual([loads(line) for line in get_tasks.data.splitlines()], tasks,
+                         'get_tasks ndjson - wrong answer')
+
+    def test_get_tasks_etag(self):
+        get_tasks = self.app.get('/tasks', headers=self.auth)
+        etag = get_tasks.headers['ETag']
+        # Список не менялся - 304 без тела
+        get_tasks = self.app.get('/tasks', headers=dict(self.auth, **{'If-None-Match': etag}))
+        self.assertEqual(get_tasks.status_code, 304, 'get_tasks etag - wrong status code')
+        self.assertEqual(get_tasks.data, b'', 'get_tasks etag - not empty body')
+        # Другие параметры запроса - другой ETag
+        get_tasks = self.app.get('/tasks?done=true', headers=dict(self.auth, **{'If-None-Match': etag}))
+        self.assertEqual(get_tasks.status_code, 200, 'get_tasks etag - wrong status code')
+        # Изменение задач меняет ETag
+        task = {'title': 'test task', 'description': 'test description', 'deadline': '2020-03-13 10:00'}
+        create_task = self.app.post('/create_task', headers=self.auth, data=dumps(task),
+                                    content_type='application/json')
+        get_tasks = self.app.get('/tasks', headers=dict(self.auth, **{'If-None-Match': etag}))
+        self.assertEqual(get_tasks.status_code, 200, 'get_tasks etag - wrong status code')
+        self.assertEqual(len(loads(get_tasks.data)['tasks']), 1, 'get_tasks etag - wrong json answer')
+        # Задача по id
+        url = f'/tasks/{loads(create_task.data)["task"]["id"]}'
+        etag = self.app.get(url, headers=self.auth).headers['ETag']
+        get_task = self.app.get(url, headers=dict(self.auth, **{'If-None-Match': etag}))
+        self.assertEqual(get_task.status_code, 304, 'get_task etag - wrong status code')
+        self.app.put(f'/done{url[6:]}', headers=self.auth)
+        get_task = self.app.get(url, headers=dict(self.auth, **{'If-None-Match': etag}))
+        self.assertEqual(get_task.status_code, 200, 'get_task etag - wrong status code')
+        self.assertEqual(loads(get_task.data)['done'], True, 'get_task etag - wrong json answer')
+
+    def test_get_tasks_cache(self):
+        tasks_cache.clear()
+        self.app.get('/tasks', headers=self.auth)
+        get_tasks = self.app.get('/tasks', headers=self.auth)
+        self.assertEqual((tasks_cache.hits, tasks_cache.misses), (1, 1), 'get_tasks cache - wrong hits and misses')
+        self.assertEqual(loads(get_tasks.data), {'tasks': []}, 'get_tasks cache - wrong json answer')
+        # Создание задачи сбрасывает кэш
+        task = {'title': 'test task', 'description': 'test description', 'deadline': '2020-03-13 10:00'}
+        self.app.post('/create_task', headers=self.auth, data=dumps(task), content_type='application/json')
+        get_tasks = self.app.get('/tasks', headers=self.auth)
+        self.assertEqual(tasks_cache.misses, 2, 'get_tasks cache - wrong misses')
+        self.assertEqual(len(loads(get_tasks.data)['tasks']), 1, 'get_tasks cache - stale json answer')
+        # Фильтры и страницы не кэшируются
+        self.app.get('/tasks?done=false', headers=self.auth)
+        self.assertEqual((tasks_cache.hits, tasks_cache.misses), (1, 2), 'get_tasks cache - filters were cached')
+
+    def test_changes(self):
+        cursor = loads(self.app.get('/tasks/changes', headers=self.auth).data)['cursor']
+        # Изменений нет
+        get_changes = self.app.get(f'/tasks/changes?since={cursor}&wait=0', headers=self.auth)
+        self.assertEqual(loads(get_changes.data), {'events': [], 'cursor': cursor}, 'changes - wrong json answer')
+        # Создание, выполнение и удаление задач
+        task = {'title': 'test task', 'description': 'test description', 'deadline': '2020-03-13 10:00'}
+        create_task = self.app.post('/create_task', headers=self.auth, data=dumps(task),
+                                    content_type='application/json')
+        task_id = loads(create_task.data)['task']['id']
+        self.app.put(f'/done/{task_id}', headers=self.auth)
+        json_answer = loads(self.app.get(f'/tasks/changes?since={cursor}&wait=0', headers=self.auth).data)
+        self.assertEqual([(event['type'], event['task_id']) for event in json_answer['events']],
+                         [('create', task_id), ('done', task_id)], 'changes - wrong events')
+        self.assertEqual(json_answer['events'][1]['task']['done'], True, 'changes - wrong task')
+        cursor = json_answer['cursor']
+        self.app.delete(f'/delete_task/{task_id}', headers=self.auth)
+        json_answer = loads(self.app.get(f'/tasks/changes?since={cursor}', headers=self.auth).data)
+        self.assertEqual([(event['type'], event['task_id']) for event in json_answer['events']],
+                         [('delete', task_id)], 'changes - wrong events')
+        # Запрос ждет следующего изменения
+        cursor = json_answer['cursor']
+        Timer(0.2, app.test_client().post, ['/create_task'],
+              {'headers': self.auth, 'data': dumps(task), 'content_type': 'application/json'}).start()
+        json_answer = loads(self.app.get(f'/tasks/changes?since={cursor}&wait=10', headers=self.auth).data)
+        self.assertEqual([event['type'] for event in json_answer['events']], ['create'], 'changes - wrong events')
+        cursor = json_answer['cursor']
+        # На сервере WSGI ожидание занимает поток: сверх CHANGES_MAX_WAITERS запрос получает 503
+        for _ in range(app.config['CHANGES_MAX_WAITERS']):
+            change_waiters.acquire()
+        try:
+            get_changes = app.test_client().get(f'/tasks/changes?since={cursor}&wait=10', headers=self.auth)
+            self.assertEqual(get_changes.status_code, 503, 'changes - wrong status code')
+            self.assertIn('Retry-After', get_changes.headers, 'changes - no Retry-After')
+            get_changes = app.test_client().get(f'/tasks/changes?since={cursor}&wait=0', headers=self.auth)
+            self.assertEqual(get_changes.status_code, 200, 'changes - wrong status code')
+        finally:
+            for _ in range(app.config['CHANGES_MAX_WAITERS']):
+                change_waiters.release()
+        # Невалидный курсор
+        get_changes = self.app.get('/tasks/changes?since=abc', headers=self.auth)
+        self.assertEqual(get_changes.status_code, 400, 'changes - wrong status code')
+        for wait in ('nan', 'inf'):
+            get_changes = self.app.get(f'/tasks/changes?since={cursor}&wait={wait}', headers=self.auth)
+            self.assertEqual(get_changes.status_code, 400, 'changes - wrong status code')
+        get_changes = self.app.get(f'/tasks/changes?since={2 ** 64}', headers=self.auth)
+        self.assertEqual(get_changes.status_code, 400, 'changes - wrong status code')
+
+    def test_overdue_and_upcoming(self):
+        soon = datetime.now() + timedelta(hours=2)
+        tasks = [{'title': 'overdue', 'description': 'test description', 'deadline': '2020-03-13 10:00'},
+                 {'title': 'soon', 'description': 'test description', 'deadline': f'{soon:%Y-%m-%d %H:%M}'},
+                 {'title': 'later', 'description': 'test description', 'deadline': '2999-03-13 10:00'}]
+        for task in tasks:
+            self.app.post('/create_task', headers=self.auth, data=dumps(task), content_type='application/json')
+        get_overdue = self.app.get('/tasks/overdue', headers=self.auth)
+        self.assertEqual([task['title'] for task in loads(get_overdue.data)['tasks']], ['overdue'],
+                         'overdue - wrong json answer')
+        get_upcoming = self.app.get('/tasks/upcoming?within=3h', headers=self.auth)
+        self.assertEqual([task['title'] for task in loads(get_upcoming.data)['tasks']], ['soon'],
+                         'upcoming - wrong json answer')
+        get_upcoming = self.app.get('/tasks/upcoming?within=1h', headers=self.auth)
+        self.assertEqual(loads(get_upcoming.data)['tasks'], [], 'upcoming - wrong json answer')
+        # Выполненная задача не просрочена
+        task_id = loads(get_overdue.data)['tasks'][0]['id']
+        self.app.put(f'/done/{task_id}', headers=self.auth)
+        get_overdue = self.app.get('/tasks/overdue', headers=self.auth)
+        self.assertEqual(loads(get_overdue.data)['tasks'], [], 'overdue - done task')
+        for within in ('abc', 'nan', 'inf', '1e12d', '3000000d'):
+            get_upcoming = self.app.get(f'/tasks/upcoming?within={within}', headers=self.auth)
+            self.assertEqual(get_upcoming.status_code, 400, 'upcoming - wrong status code')
+
+    def test_notify_due(self):
+        SchedulerState.query.delete()  # Сканирование с начала, курсор мог остаться от других тестов
+        db.session.commit()
+        cursor = loads(self.app.get('/tasks/changes', headers=self.auth).data)['cursor']
+        for deadline in ('2020-03-13 10:00', '2999-03-13 10:00'):
+            task = {'title': 'test task', 'description': 'test description', 'deadline': deadline}
+            self.app.post('/create_task', headers=self.auth, data=dumps(task), content_type='application/json')
+        result = app.test_cli_runner().invoke(args=['notify-due', '--batch-size', '1'])
+        self.assertIn('due tasks notified', result.output, 'notify-due - wrong output')
+        self.assertIn('events pruned', result.output, 'notify-due - wrong output')
+        json_answer = loads(self.app.get(f'/tasks/changes?since={cursor}&wait=0', headers=self.auth).data)
+        due = [event for event in json_answer['events'] if event['type'] == 'due']
+        self.assertEqual([event['task']['deadline'] for event in due], ['2020-03-13 10:00'],
+                         'notify-due - wrong events')
+        # Повторный запуск не уведомляет о той же задаче
+        app.test_cli_runner().invoke(args=['notify-due'])
+        json_answer = loads(self.app.get(f'/tasks/changes?since={json_answer["cursor"]}&wait=0',
+                                         headers=self.auth).data)
+        self.assertEqual(json_answer['events'], [], 'notify-due - repeated events')
+
+    def test_prune_events(self):
+        cursor = loads(self.app.get('/tasks/changes', headers=self.auth).data)['cursor']
+        task = {'title': 'test task', 'description': 'test description', 'deadline': '2020-03-13 10:00'}
+        self.app.post('/create_task', headers=self.auth, data=dumps(task), content_type='application/json')
+        try:
+            code, _, deleted = service.prune_events(datetime.utcnow() + timedelta(seconds=1), 2)
+            self.assertEqual(code, 0, 'prune_events - wrong code')
+            self.assertGreaterEqual(deleted, 1, 'prune_events - events were not deleted')
+            # Курсор старше удаленных событий - список нужно перечитать
+            json_answer = loads(self.app.get(f'/tasks/changes?since={cursor}&wait=0', headers=self.auth).data)
+            self.assertEqual([event['type'] for event in json_answer['events']], ['reload'], 'prune - wrong events')
+            json_answer = loads(self.app.get(f'/tasks/changes?since={json_answer["cursor"]}&wait=0',
+                                             headers=self.auth).data)
+            self.assertEqual(json_answer['events'], [], 'prune - repeated reload')
+            # Новый курсор не старше удаленных событий
+            cursor = loads(self.app.get('/tasks/changes', headers=self.auth).data)['cursor']
+            json_answer = loads(self.app.get(f'/tasks/changes?since={cursor}&wait=0', headers=self.auth).data)
+            self.assertEqual(json_answer['events'], [], 'prune - wrong cursor')
+        finally:
+            SchedulerState.query.filter_by(name='pruned_events').delete()
+            db.session.commit()
+
+    def test_recover_jobs(self):
+        # Задания процесса, перезапущенного до их завершения
+        _, _, user = service.create_user('lost_user', 'pass')
+        service.create_task({'title': 'test task', 'description': 'test description', 'deadline': '2020-03-13 10:00'},
+                            user)
+        created = datetime.utcnow() - timedelta(seconds=app.config['JOB_TIMEOUT'] + 60)
+        jobs = {'delete_user': Job(id=uuid4().hex, user_id=user.id, kind='delete_user', status='running',
+                                   created=created),
+                'import': Job(id=uuid4().hex, user_id=user.id, kind='import', status='queued', created=created),
+                'recent': Job(id=uuid4().hex, user_id=user.id, kind='import', status='queued')}
+        db.session.add_all(jobs.values())
+        db.session.commit()
+        ids = {kind: job.id for kind, job in jobs.items()}
+        result = app.test_cli_runner().invoke(args=['notify-due'])
+        self.assertIn('lost jobs recovered', result.output, 'recover_jobs - wrong output')
+        statuses = {kind: loads(self.app.get(f'/jobs/{job_id}').data)['status'] for kind, job_id in ids.items()}
+        self.assertEqual(statuses, {'delete_user': 'done', 'import': 'failed', 'recent': 'queued'},
+                         'recover_jobs - wrong statuses')
+        self.assertIsNone(User.query.filter_by(login='lost_user').first(), 'recover_jobs - user was not deleted')
+        Job.query.filter(Job.id.in_(ids.values())).delete(synchronize_session=False)
+        db.session.commit()
+
+    def test_get_tasks_gzip(self):
+        tasks = [{'title': f'task {i}', 'description': 'test description', 'deadline': '2020-03-13 10:00'}
+                 for i in range(50)]
+        self.app.post('/create_tasks', headers=self.auth, data=dumps(tasks), content_type='application/json')
+        get_tasks = self.app.get('/tasks', headers=dict(self.auth, **{'Accept-Encoding': 'gzip'}))
+        self.assertEqual(get_tasks.headers.get('Content-Encoding'), 'gzip', 'get_tasks gzip - not compressed')
+        self.assertEqual(len(loads(gzip.decompress(get_tasks.data))['tasks']), 50, 'get_tasks gzip - wrong answer')
+        # Потоковый ответ сжимается по частям
+        get_tasks = self.app.get('/tasks?stream=1', headers=dict(self.auth, **{'Accept-Encoding': 'gzip'}))
+        self.assertEqual(len(loads(gzip.decompress(get_tasks.data))['tasks']), 50, 'get_tasks gzip - wrong answer')
+        # Маленький ответ не сжимается
+        get_tasks = self.app.get('/tasks?limit=1', headers=dict(self.auth, **{'Accept-Encoding': 'gzip'}))
+        self.assertNotIn('Content-Encoding', get_tasks.headers, 'get_tasks gzip - small answer compressed')
+
+    @unittest.skipIf(encoding.msgpack is None, 'msgpack is not installed')
+    def test_get_tasks_msgpack(self):
+        task = {'title': 'test task', 'description': 'test description', 'deadline': '2020-03-13 10:00'}
+        self.app.post('/create_task', headers=self.auth, data=dumps(task), content_type='application/json')
+        json_answer = loads(self.app.get('/tasks', headers=self.auth).data)
+        get_tasks = self.app.get('/tasks', headers=dict(self.auth, Accept='application/msgpack'))
+        self.assertEqual(get_tasks.mimetype, 'application/msgpack', 'get_tasks msgpack - wrong mimetype')
+        self.assertEqual(encoding.msgpack.unpackb(get_tasks.data, raw=False), json_answer,
+                         'get_tasks msgpack - wrong answer')
+
     def test_get_task(self):
         # Если отсутствует задача с таким id
         get_task = self.app.get('/tasks/10', headers=self.auth)
@@ -177,6 +660,39 @@ class TestRoutes(unittest.TestCase):
                          'done_task - wrong json answer [message]')
         self.assertEqual(json_answer['task']['done'], True, 'done_task - wrong json answer [done]')
 
+    def test_bulk_done_and_delete(self):
+        tasks = [{'title': f'task {i}', 'description': 'test description', 'deadline': '2020-03-13 10:00'}
+                 for i in range(3)]
+        self.app.post('/create_tasks', headers=self.auth, data=dumps(tasks), content_type='application/json')
+        ids = [task['id'] for task in loads(self.app.get('/tasks', headers=self.auth).data)['tasks']]
+        # Невалидное тело запроса
+        for wrong_ids in (['a'], [2 ** 64]):
+            done_tasks = self.app.put('/done_tasks', headers=self.auth, data=dumps({'ids': wrong_ids}),
+                                      content_type='application/json')
+            self.assertEqual(done_tasks.status_code, 400, 'done_tasks - wrong status code')
+        # id вне диапазона INTEGER SQLite
+        self.assertEqual(self.app.put(f'/done/{2 ** 64}', headers=self.auth).status_code, 404,
+                         'done_task - wrong status code')
+        self.assertEqual(self.app.get(f'/tasks/{2 ** 64}', headers=self.auth).status_code, 404,
+                         'get_task - wrong status code')
+        # Отметить две задачи и несуществующую
+        done_tasks = self.app.put('/done_tasks', headers=self.auth, data=dumps({'ids': ids[:2] + [0]}),
+                                  content_type='application/json')
+        json_answer = loads(done_tasks.data)
+        self.assertEqual(done_tasks.status_code, 200, 'done_tasks - wrong status code')
+        self.assertEqual(json_answer['ids'], ids[:2], 'done_tasks - wrong json answer [ids]')
+        self.assertEqual(json_answer['not_found'], [0], 'done_tasks - wrong json answer [not_found]')
+        json_answer = loads(self.app.get('/tasks?done=true', headers=self.auth).data)
+        self.assertEqual([task['id'] for task in json_answer['tasks']], ids[:2], 'done_tasks - tasks were not marked')
+        # Удалить задачи
+        delete_tasks = self.app.delete('/delete_tasks', headers=self.auth, data=dumps({'ids': ids[1:]}),
+                                       content_type='application/json')
+        json_answer = loads(delete_tasks.data)
+        self.assertEqual(delete_tasks.status_code, 200, 'delete_tasks - wrong status code')
+        self.assertEqual(json_answer['ids'], ids[1:], 'delete_tasks - wrong json answer [ids]')
+        json_answer = loads(self.app.get('/tasks', headers=self.auth).data)
+        self.assertEqual([task['id'] for task in json_answer['tasks']], ids[:1], 'delete_tasks - tasks were not deleted')
+
     def test_delete_task(self):
         # Удалить несуществующую задачу
         delete_task = self.app.delete('/delete_task/10', headers=self.auth)
@@ -194,6 +710,415 @@ class TestRoutes(unittest.TestCase):
         self.assertEqual(json_answer['message'], f'task {id_task} was deleted',
                          'delete_task - wrong json answer [message]')
 
+    def test_token(self):
+        get_token = self.app.get('/token', headers=self.auth)
+        json_answer = loads(get_token.data)
+        self.assertEqual(get_token.status_code, 200, 'token - wrong status code')
+        self.assertIn('token', json_answer, 'token - wrong json answer')
+        # Токен передается вместо логина с пустым паролем
+        headers = {'Authorization': 'Basic ' + b64encode(f"{json_answer['token']}:".encode()).decode()}
+        get_tasks = self.app.get('/tasks', headers=headers)
+        self.assertEqual(get_tasks.status_code, 200, 'token - wrong status code')
+        # Новый токен по токену не выдается
+        get_token = self.app.get('/token', headers=headers)
+        self.assertEqual(get_token.status_code, 401, 'token - wrong status code')
+        # Поддельный токен
+        headers = {'Authorization': 'Basic ' + b64encode(f"{json_answer['token']}x:".encode()).decode()}
+        get_tasks = self.app.get('/tasks', headers=headers)
+        self.assertEqual(get_tasks.status_code, 401, 'token - wrong status code')
+        # Токен удаленного пользователя не подходит новому пользователю с тем же логином
+        headers = {'Authorization': 'Basic ' + b64encode(f"{json_answer['token']}:".encode()).decode()}
+        self.app.delete('/delete_user', headers=self.auth)
+        self.app.post('/create_user', data=dumps(dict(self.user, password='other')), content_type='application/json')
+        get_tasks = self.app.get('/tasks', headers=headers)
+        self.assertEqual(get_tasks.status_code, 401, 'token - token of a deleted user')
+        self.app.delete('/delete_user', headers=headers)
+        self.app.delete('/delete_user', headers={
+            'Authorization': 'Basic ' + b64encode(f"{self.user['login']}:other".encode()).decode()})
+        # Токен не действует после смены пароля
+        self.app.post('/create_user', data=dumps(self.user), content_type='application/json')
+        token = loads(self.app.get('/token', headers=self.auth).data)['token']
+        user = User.query.filter_by(login=self.user['login']).first()
+        user.set_password('changed')
+        db.session.commit()
+        headers = {'Authorization': 'Basic ' + b64encode(f"{token}:".encode()).decode()}
+        self.assertEqual(self.app.get('/tasks', headers=headers).status_code, 401, 'token - password was changed')
+        user = User.query.filter_by(login=self.user['login']).first()  # Сессия закрыта после запроса
+        user.set_password(self.user['password'])
+        db.session.commit()
+
+    def test_rate_limit(self):
+        limits = rate_limiter.limits
+        rate_limiter.limits = {'get_tasks': (0.01, 2)}
+        try:
+            statuses = [self.app.get('/tasks', headers=self.auth).status_code for _ in range(2)]
+            self.assertEqual(statuses, [200, 200], 'rate limit - burst was rejected')
+            get_tasks = self.app.get('/tasks', headers=self.auth)
+            self.assertEqual(get_tasks.status_code, 429, 'rate limit - wrong status code')
+            self.assertEqual(get_tasks.headers['Retry-After'], '100', 'rate limit - wrong Retry-After')
+            # Другие методы не ограничены
+            self.assertEqual(self.app.get('/tasks/1', headers=self.auth).status_code, 404, 'rate limit - wrong route')
+        finally:
+            rate_limiter.limits = limits
+
+
+class TestRoutesASGI(TestRoutes):
+    """The same tests against the ASGI entry point"""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.app = ASGIClient(application)
+
+    def test_asgi_limits(self):
+        # Ожидание изменений прерывается, когда клиент отключается
+        cursor = loads(self.app.get('/tasks/changes', headers=self.auth).data)['cursor']
+        scope = {'type': 'http', 'method': 'GET', 'path': '/tasks/changes',
+                 'query_string': f'since={cursor}&wait=10'.encode(),
+                 'headers': [(name.lower().encode(), value.encode()) for name, value in self.auth.items()]}
+        messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+        async def receive():
+            return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+        async def send(message):
+            pass
+
+        start = monotonic()
+        asyncio.run(application(scope, receive, send))
+        self.assertLess(monotonic() - start, 5, 'asgi - waiting after disconnect')
+        # Все потоки заняты и очередь заполнена
+        busy = WSGIApplication(app, 1, 0)
+        busy.pending = 1
+        get_tasks = ASGIClient(busy).get('/tasks', headers=self.auth)
+        self.assertEqual(get_tasks.status_code, 503, 'asgi - wrong status code')
+        self.assertEqual(get_tasks.headers['Retry-After'], '1', 'asgi - wrong Retry-After')
+
+    def test_long_polls_without_threads(self):
+        # Ожидающие запросы не занимают потоков: 20 запросов ждут изменений на одном потоке
+        cursor = loads(self.app.get('/tasks/changes', headers=self.auth).data)['cursor']
+        client = ASGIClient(WSGIApplication(app, 1, 20, change_notifier))
+        task = {'title': 'test task', 'description': 'test description', 'deadline': '2020-03-13 10:00'}
+
+        async def long_polls() -> list:
+            polls = [asyncio.ensure_future(client.request('get', f'/tasks/changes?since={cursor}&wait=10',
+                                                          headers=self.auth)) for _ in range(20)]
+            while client.asgi_app.long_polls < 20:
+                await asyncio.sleep(0.01)
+            await asyncio.get_running_loop().run_in_executor(None, lambda: app.test_client().post(
+                '/create_task', headers=self.auth, data=dumps(task), content_type='application/json'))
+            return await asyncio.gather(*polls)
+
+        start = monotonic()
+        responses = asyncio.run(asyncio.wait_for(long_polls(), 10))
+        self.assertLess(monotonic() - start, 5, 'long polls - notification was not delivered')
+        self.assertEqual({response.status_code for response in responses}, {200}, 'long polls - wrong status code')
+        self.assertEqual({tuple(event['type'] for event in loads(response.data)['events']) for response in responses},
+                         {('create',)}, 'long polls - wrong events')
+
+    def test_chunked_body(self):
+        # Тело без Content-Length приходит частями
+        task = dumps({'title': 'chunked', 'description': 'test description', 'deadline': '2020-03-13 10:00'}).encode()
+        scope = {'type': 'http', 'method': 'POST', 'path': '/create_task', 'query_string': b'',
+                 'headers': [(b'content-type', b'application/json'), (b'transfer-encoding', b'chunked')] +
+                            [(name.lower().encode(), value.encode()) for name, value in self.auth.items()]}
+        messages = [{'type': 'http.request', 'body': task[:10], 'more_body': True},
+                    {'type': 'http.request', 'body': task[10:], 'more_body': False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(application(scope, receive, send))
+        self.assertEqual(sent[0]['status'], 201, 'chunked - wrong status code')
+
+
+class TestMetrics(unittest.TestCase):
+    def test_metrics(self):
+        client = app.test_client()
+        client.get('/tasks')
+        get_metrics = client.get('/metrics')
+        self.assertEqual(get_metrics.status_code, 200, 'metrics - wrong status code')
+        text = get_metrics.data.decode()
+        self.assertIn('list_tasks_request_duration_seconds_count{endpoint="get_tasks",method="GET",status="401"}', text,
+                      'metrics - no request duration')
+        self.assertIn('list_tasks_stage_duration_seconds_bucket{endpoint="get_tasks",stage="auth",le="+Inf"}', text,
+                      'metrics - no auth duration')
+        self.assertIn('list_tasks_db_statements_total{endpoint="get_tasks"}', text, 'metrics - no db statements')
+        self.assertIn('list_tasks_cache_requests_total{cache="tasks",result="hit"}', text, 'metrics - no cache')
+
+    def test_stages_do_not_overlap(self):
+        with app.test_request_context('/tasks'):
+            app.preprocess_request()
+            with metrics.timer('auth', exclude=('db',)):
+                sleep(0.05)
+                with metrics.timer('db'):
+                    sleep(0.1)
+            self.assertLess(g.metrics['auth'], 0.09, 'metrics - db time counted in auth')
+            self.assertGreaterEqual(g.metrics['db'], 0.1, 'metrics - no db time')
+
+
+class TestCredentialCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.app = app.test_client()
+        self.user = {'login': 'cache_user', 'password': 'pass'}
+        self.auth = {
+            'Authorization': 'Basic ' + b64encode(f"{self.user['login']}:{self.user['password']}".encode()).decode()}
+        self.app.post('/create_user', data=dumps(self.user), content_type='application/json')
+        credential_cache.clear()
+
+    def tearDown(self) -> None:
+        self.app.delete('/delete_user', headers=self.auth)
+
+    def test_cache_hit(self):
+        # Первый запрос проверяет пароль, второй берет результат из кэша
+        self.app.get('/tasks', headers=self.auth)
+        self.app.get('/tasks', headers=self.auth)
+        self.assertEqual(credential_cache.hits, 1, 'credential cache - wrong hits')
+        self.assertEqual(credential_cache.misses, 1, 'credential cache - wrong misses')
+        # Неверный пароль не проходит через кэш
+        headers = {'Authorization': 'Basic ' + b64encode(f"{self.user['login']}:wrong".encode()).decode()}
+        get_tasks = self.app.get('/tasks', headers=headers)
+        self.assertEqual(get_tasks.status_code, 401, 'credential cache - wrong status code')
+
+    def test_invalidate_on_delete_user(self):
+        self.app.get('/tasks', headers=self.auth)
+        self.assertEqual(len(credential_cache), 1, 'credential cache - entry was not added')
+        self.app.delete('/delete_user', headers=self.auth)
+        self.assertEqual(len(credential_cache), 0, 'credential cache - entry was not dropped')
+
+    def test_ttl_and_size(self):
+        cache = CredentialCache('secret', size=1, ttl=0)
+        cache.add('user1', 'hash', 'pass')
+        self.assertFalse(cache.check('user1', 'hash', 'pass'), 'credential cache - expired entry hit')
+        cache.ttl = 60
+        cache.add('user1', 'hash', 'pass')
+        cache.add('user2', 'hash', 'pass')
+        self.assertFalse(cache.check('user1', 'hash', 'pass'), 'credential cache - evicted entry hit')
+        self.assertFalse(cache.check('user2', 'changed', 'pass'), 'credential cache - changed password hit')
+
+    def test_lru_cache(self):
+        cache = LRUCache(size=2)
+        cache.set('a', b'1')
+        cache.set('b', b'2')
+        cache.get('a')
+        cache.set('c', b'3')
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (b'1', None, b'3'),
+                         'lru cache - wrong eviction')
+        cache = LRUCache(size=10, max_bytes=4)
+        cache.set('a', b'11')
+        cache.set('b', b'22')
+        cache.set('c', b'33')
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (None, b'22', b'33'),
+                         'lru cache - wrong eviction by size in bytes')
+        cache.set('d', b'44444')
+        self.assertEqual((cache.get('b'), cache.get('d'), cache.bytes), (b'22', None, 4),
+                         'lru cache - value larger than the cache stored')
+        cache.set('b', b'2')
+        cache.delete('c')
+        self.assertEqual(cache.bytes, 1, 'lru cache - wrong size in bytes')
+
+
+class TestQueryCount(unittest.TestCase):
+    def setUp(self) -> None:
+        self.app = app.test_client()
+        self.user = {'login': 'count_user', 'password': 'pass'}
+        self.auth = {
+            'Authorization': 'Basic ' + b64encode(f"{self.user['login']}:{self.user['password']}".encode()).decode()}
+        self.app.post('/create_user', data=dumps(self.user), content_type='application/json')
+        task = {'title': 'test task', 'description': 'test description', 'deadline': '2020-03-13 10:00'}
+        create_task = self.app.post('/create_task', headers=self.auth, data=dumps(task),
+                                    content_type='application/json')
+        self.task_id = loads(create_task.data)['task']['id']
+
+    def tearDown(self) -> None:
+        self.app.delete('/delete_user', headers=self.auth)
+
+    @contextmanager
+    def count_queries(self) -> list:
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    def test_query_count(self):
+        # Пользователь загружается один раз за запрос
+        task = {'title': 'test task', 'description': 'test description', 'deadline': '2020-03-13 10:00'}
+        for method, url, expected in (('get', '/tasks', 2),
+                                      ('get', f'/tasks/{self.task_id}', 2),
+                                      ('post', '/create_task', 5),
+                                      ('put', f'/done/{self.task_id}', 6),
+                                      ('delete', f'/delete_task/{self.task_id}', 5)):
+            with self.count_queries() as statements:
+                response = getattr(self.app, method)(url, headers=self.auth, data=dumps(task),
+                                                     content_type='application/json')
+            self.assertLess(response.status_code, 300, f'{method} {url} - wrong status code')
+            self.assertEqual(len(statements), expected, f'{method} {url} - wrong number of queries: {statements}')
+
+
+class TestChangeNotifier(unittest.TestCase):
+    def test_wait(self):
+        notifier = ChangeNotifier()
+        version = notifier.version(1)
+        self.assertFalse(notifier.wait(1, version, 0.01), 'change notifier - wakeup without changes')
+        Timer(0.05, notifier.notify, [{1}]).start()
+        self.assertTrue(notifier.wait(1, version, 5), 'change notifier - no wakeup')
+        # Уведомление до начала ожидания не теряется
+        self.assertTrue(notifier.wait(1, version, 0), 'change notifier - lost notification')
+
+    def test_subscribe(self):
+        notifier = ChangeNotifier()
+        calls = []
+
+        def callback():
+            calls.append(1)
+
+        notifier.subscribe(1, callback)
+        notifier.notify({1, 2})
+        self.assertEqual(calls, [1], 'change notifier - wrong callbacks')
+        notifier.unsubscribe(1, callback)
+        notifier.notify({1})
+        self.assertEqual(calls, [1], 'change notifier - callback after unsubscribe')
+
+
+class TestLimits(unittest.TestCase):
+    def test_parse_limits(self):
+        self.assertEqual(parse_limits('get_tasks=20/100, *=5'), {'get_tasks': (20, 100), '*': (5, 5)},
+                         'limits - wrong parsing')
+
+    def test_token_bucket(self):
+        store = MemoryBucketStore()
+        self.assertEqual([store.take('user', 10, 2) for _ in range(2)], [0, 0], 'token bucket - burst was rejected')
+        self.assertGreater(store.take('user', 10, 2), 0, 'token bucket - empty bucket gave a token')
+        self.assertEqual(store.take('other', 10, 2), 0, 'token bucket - buckets are not separate')
+        sleep(0.15)
+        self.assertEqual(store.take('user', 10, 2), 0, 'token bucket - bucket was not refilled')
+
+    def test_single_flight(self):
+        flight = SingleFlight()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            sleep(0.2)
+            return len(calls)
+
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(lambda _: flight.do('key', slow), range(4)))
+        self.assertEqual(len(calls), 1, 'single flight - the function was called more than once')
+        self.assertEqual(sorted(shared for _, shared in results), [False, True, True, True],
+                         'single flight - wrong shared results')
+        self.assertEqual({result for result, _ in results}, {1}, 'single flight - wrong result')
+
+
+class TestSerializers(unittest.TestCase):
+    def test_task_row(self):
+        task = Task(id=1, title='task', description='description', deadline=datetime(2020, 3, 13, 10, 0), done=False)
+        row = tuple(getattr(task, column.key) for column in serializers.TASK_COLUMNS)
+        self.assertEqual(serializers.task_row_to_dict(row), task.to_dict(), 'serializers - wrong dict')
+        with app.app_context():
+            self.assertEqual(loads(serializers.dumps({'tasks': [task.to_dict()]})),
+                             loads(jsonify({'tasks': [task.to_dict()]}).get_data()), 'serializers - wrong json')
+
+
+class TestReplica(unittest.TestCase):
+    def setUp(self) -> None:
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.engine = create_engine('sqlite:///' + self.path)
+        db.Model.metadata.create_all(self.engine)
+        self.replica = scoped_session(sessionmaker(bind=self.engine))
+        self.saved = service.replica_session, service.recent_writes
+        service.replica_session, service.recent_writes = self.replica, RecentWrites(LRUCache(10), 60)
+        self.app = app.test_client()
+        self.user = {'login': 'replica_user', 'password': 'pass'}
+        self.auth = {
+            'Authorization': 'Basic ' + b64encode(f"{self.user['login']}:{self.user['password']}".encode()).decode()}
+        self.app.post('/create_user', data=dumps(self.user), content_type='application/json')
+
+    def tearDown(self) -> None:
+        service.recent_writes.mark(self.user['login'])  # Удаляется пользователь основной базы
+        self.app.delete('/delete_user', headers=self.auth)
+        service.replica_session, service.recent_writes = self.saved
+        self.replica.remove()
+        self.engine.dispose()
+        os.remove(self.path)
+
+    def test_read_your_writes(self):
+        # Сразу после своих изменений пользователь читает из основной базы, реплика их еще не получила
+        task = {'title': 'test task', 'description': 'test description', 'deadline': '2020-03-13 10:00'}
+        create_task = self.app.post('/create_task', headers=self.auth, data=dumps(task),
+                                    content_type='application/json')
+        task_id = loads(create_task.data)['task']['id']
+        self.assertEqual(len(loads(self.app.get('/tasks', headers=self.auth).data)['tasks']), 1,
+                         'replica - own write was not read')
+        # После окна чтения идут в реплику
+        service.recent_writes.clear()
+        self.assertEqual(self.app.get('/tasks', headers=self.auth).status_code, 401, 'replica - read from primary')
+        user = User.query.filter_by(login=self.user['login']).first()
+        self.replica.execute(User.__table__.insert(), {'id': user.id, 'login': user.login,
+                                                       'password_hash': user.password_hash, 'tasks_version': 0})
+        self.replica.commit()
+        self.assertEqual(loads(self.app.get('/tasks', headers=self.auth).data)['tasks'], [],
+                         'replica - read from primary')
+        self.assertEqual(self.app.get(f'/tasks/{task_id}', headers=self.auth).status_code, 404,
+                         'replica - read from primary')
+        # Пользователь загружен из реплики, но изменение пишется в основную базу
+        done_task = self.app.put(f'/done/{task_id}', headers=self.auth)
+        self.assertEqual(done_task.status_code, 200, 'replica - wrong status code')
+        self.assertEqual(loads(self.app.get(f'/tasks/{task_id}', headers=self.auth).data)['done'], True,
+                         'replica - own write was not read')
+
+
+class TestStorage(unittest.TestCase):
+    def test_sqlite_wal_pragmas(self):
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        engine = create_engine('sqlite:///' + path)
+        event.listen(engine, 'connect', sqlite_pragmas_listener(PROFILES['sqlite-wal']['pragmas']))
+        try:
+            with engine.connect() as connection:
+                self.assertEqual(connection.execute('PRAGMA journal_mode').scalar(), 'wal', 'storage - wrong journal_mode')
+                self.assertEqual(connection.execute('PRAGMA synchronous').scalar(), 1, 'storage - wrong synchronous')
+                self.assertEqual(connection.execute('PRAGMA busy_timeout').scalar(), 30000,
+                                 'storage - wrong busy_timeout')
+        finally:
+            engine.dispose()
+            os.remove(path)
+
+    def test_pragmas_on_primary_engine_only(self):
+        paths = []
+        for _ in range(2):
+            fd, path = tempfile.mkstemp(suffix='.db')
+            os.close(fd)
+            paths.append(path)
+        storage_app = Flask(__name__)
+        storage_app.config.update(STORAGE_PROFILE='sqlite-wal', SQLALCHEMY_DATABASE_URI='sqlite:///' + paths[0],
+                                  SQLALCHEMY_TRACK_MODIFICATIONS=False, REPLICA_DATABASE_URI='sqlite:///' + paths[1])
+        configure_storage(storage_app)
+        storage_db = SQLAlchemy(storage_app)
+        configure_engine(storage_db, storage_app)
+        replica = create_replica_session(storage_app)
+        try:
+            with storage_app.app_context():
+                self.assertEqual(storage_db.session.execute('PRAGMA journal_mode').scalar(), 'wal',
+                                 'storage - pragmas were not applied')
+                self.assertEqual(replica.execute('PRAGMA journal_mode').scalar(), 'delete',
+                                 'storage - pragmas were applied to the replica')
+        finally:
+            storage_db.get_engine(storage_app).dispose()
+            replica.get_bind().dispose()
+            for path in paths:
+                os.remove(path)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,6 @@
+"""Benchmarks of the app List of tasks
+
+Run from the root of the project, e.g. ``python -m benchmarks.auth_cache``;
+``python -m benchmarks`` runs the load test of every route (benchmarks.load).
+Every benchmark works on a temporary database and never touches app.db.
+"""
@@ -0,0 +1,42 @@
+"""Requests/sec on GET /tasks with and without the credential cache
+"""
+import argparse
+import os
+
+from benchmarks.common import use_temp_database, basic_auth, requests_per_second
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--tasks', type=int, default=10)
+    args = parser.parse_args()
+
+    path = use_temp_database()
+    from app import app, db, credential_cache
+    import app.model.services as service
+
+    try:
+        db.create_all()
+        _, _, user = service.create_user('bench', 'pass')
+        for i in range(args.tasks):
+            service.create_task({'title': f'task {i}', 'description': '', 'deadline': '2020-03-13 10:00'}, user)
+        client = app.test_client()
+        headers = basic_auth('bench', 'pass')
+        size = credential_cache.size
+
+        credential_cache.size = 0
+        without_cache = requests_per_second(client, '/tasks', headers, args.requests)
+        credential_cache.size = size
+        credential_cache.clear()
+        with_cache = requests_per_second(client, '/tasks', headers, args.requests)
+
+        print(f'GET /tasks without cache: {without_cache:8.1f} req/s')
+        print(f'GET /tasks with cache:    {with_cache:8.1f} req/s '
+              f'(hit rate {credential_cache.hit_rate:.1%})')
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Time to import tasks through /create_tasks compared to one /create_task per task
+"""
+import argparse
+import os
+from json import dumps
+from time import perf_counter
+
+from benchmarks.common import use_temp_database, basic_auth
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tasks', type=int, default=100000)
+    parser.add_argument('--single', type=int, default=500, help='tasks created one by one for comparison')
+    args = parser.parse_args()
+
+    path = use_temp_database()
+    from app import app, db
+    import app.model.services as service
+
+    try:
+        db.create_all()
+        service.create_user('bench', 'pass')
+        client = app.test_client()
+        headers = basic_auth('bench', 'pass')
+        task = {'title': 'task', 'description': 'description', 'deadline': '2020-03-13 10:00'}
+
+        start = perf_counter()
+        for _ in range(args.single):
+            client.post('/create_task', headers=headers, data=dumps(task), content_type='application/json')
+        single = (perf_counter() - start) / args.single
+
+        batch_size = app.config['BULK_TASKS_LIMIT']
+        app.config['BULK_TASKS_ASYNC_THRESHOLD'] = batch_size  # Пакеты создаются в запросе, а не фоновым заданием
+        start = perf_counter()
+        for offset in range(0, args.tasks, batch_size):
+            batch = [task] * min(batch_size, args.tasks - offset)
+            response = client.post('/create_tasks', headers=headers, data=dumps(batch),
+                                   content_type='application/json')
+            assert response.status_code == 201, response.data
+        bulk = perf_counter() - start
+
+        print(f'/create_task:  {single * 1000:8.2f} ms per task, {single * args.tasks:8.1f} s for {args.tasks}')
+        print(f'/create_tasks: {bulk / args.tasks * 1000:8.2f} ms per task, {bulk:8.1f} s for {args.tasks}')
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
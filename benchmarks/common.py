@@ -0,0 +1,42 @@
+"""Helpers shared by the benchmarks
+"""
+import os
+import tempfile
+from base64 import b64encode
+from time import perf_counter
+
+
+def use_temp_database() -> str:
+    """Points the app at a fresh temporary SQLite database
+
+    Must be called before the first import of the app package.
+
+    :return: path to the database file
+
+    """
+
+    fd, path = tempfile.mkstemp(prefix='list-tasks-bench-', suffix='.db')
+    os.close(fd)
+    os.environ['DATABASE_URL'] = 'sqlite:///' + path
+    return path
+
+
+def basic_auth(login: str, password: str) -> dict:
+    return {'Authorization': 'Basic ' + b64encode(f'{login}:{password}'.encode()).decode()}
+
+
+def requests_per_second(client, url: str, headers: dict, count: int) -> float:
+    """Sends count GET requests and returns the achieved throughput"""
+
+    start = perf_counter()
+    for _ in range(count):
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200, response.data
+    return count / (perf_counter() - start)
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest-rank percentile of a list of numbers"""
+
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
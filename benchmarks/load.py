@@ -0,0 +1,259 @@
+"""Load test of every route of the API
+
+Seeds users with tasks through the services layer, then every scenario is driven by
+concurrent clients, one user per client. Requests go through the Flask test client or,
+with --server, through HTTP to a local threaded server on the same database.
+Throughput and latency percentiles are printed and saved as JSON, so results of two
+commits can be compared with --compare.
+"""
+import argparse
+import json
+import os
+import subprocess
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from time import perf_counter
+from uuid import uuid4
+
+from benchmarks.common import use_temp_database, basic_auth, percentile
+from benchmarks.seed import seed, seed_users_fast, PASSWORD, TASK
+
+
+class TestClient(object):
+    """Requests through the Flask test client, without the network"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method: str, url: str, headers: dict, body: bytes) -> int:
+        response = self.client.open(url, method=method, headers=headers, data=body)
+        response.get_data()  # Потоковые ответы читаются до конца
+        return response.status_code
+
+
+class HTTPClient(object):
+    """Requests over HTTP to a running server"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+
+    def request(self, method: str, url: str, headers: dict, body: bytes) -> int:
+        request = urllib.request.Request(self.base_url + url, data=body, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code
+
+
+class Client(object):
+    """State of one concurrent client: its user, its tasks and a request counter"""
+
+    def __init__(self, transport, number: int, login: str):
+        self.transport = transport
+        self.number = number
+        self.login = login
+        self.auth = basic_auth(login, PASSWORD)
+        self.task_ids = []
+        self.spare_logins = []
+        self.job_id = None
+        self.sent = 0
+
+    def take_ids(self, count: int) -> list:
+        ids, self.task_ids = self.task_ids[:count], self.task_ids[count:]
+        return ids
+
+    def pick_id(self) -> int:
+        return self.task_ids[self.sent % len(self.task_ids)] if self.task_ids else 0
+
+
+def json_body(data) -> bytes:
+    return json.dumps(data).encode()
+
+
+IMPORT_BODY = b''.join(json_body(TASK) + b'\n' for _ in range(100))
+
+
+# Сценарий возвращает (метод, url, тело, нужна ли авторизация)
+SCENARIOS = {
+    'index': lambda c: ('GET', '/', None, False),
+    'metrics': lambda c: ('GET', '/metrics', None, False),
+    'token': lambda c: ('GET', '/token', None, True),
+    'get_tasks': lambda c: ('GET', '/tasks', None, True),
+    'get_tasks_page': lambda c: ('GET', '/tasks?limit=50', None, True),
+    'get_tasks_stream': lambda c: ('GET', '/tasks?stream=1', None, True),
+    'get_overdue': lambda c: ('GET', '/tasks/overdue?limit=50', None, True),
+    'get_upcoming': lambda c: ('GET', '/tasks/upcoming?within=7d', None, True),
+    'get_task': lambda c: ('GET', f'/tasks/{c.pick_id()}', None, True),
+    'export': lambda c: ('GET', '/export', None, True),
+    'export_csv': lambda c: ('GET', '/export?format=csv', None, True),
+    'get_changes': lambda c: ('GET', '/tasks/changes?since=0&wait=0', None, True),
+    'create_task': lambda c: ('POST', '/create_task', json_body(TASK), True),
+    'create_tasks': lambda c: ('POST', '/create_tasks', json_body([TASK] * 100), True),
+    'import': lambda c: ('POST', '/import', IMPORT_BODY, True),
+    'get_job': lambda c: ('GET', f'/jobs/{c.job_id}', None, False),
+    'done_task': lambda c: ('PUT', f'/done/{c.pick_id()}', None, True),
+    'done_tasks': lambda c: ('PUT', '/done_tasks', json_body({'ids': c.task_ids[:50]}), True),
+    'delete_task': lambda c: ('DELETE', f'/delete_task/{c.take_ids(1)[0]}', None, True),
+    'delete_tasks': lambda c: ('DELETE', '/delete_tasks', json_body({'ids': c.take_ids(10)}), True),
+    'create_user': lambda c: ('POST', '/create_user',
+                              json_body({'login': f'new{c.number}_{c.sent}', 'password': PASSWORD}), False),
+    'delete_user': lambda c: ('DELETE', '/delete_user', None, c.spare_logins.pop()),
+}
+# Тип тела запроса, если не JSON
+CONTENT_TYPES = {'import': 'application/x-ndjson'}
+
+
+def prepare(app, clients: list, scenario: str, requests: int):
+    """Untimed preparation of a scenario: current task ids, users to delete and finished jobs"""
+
+    from app import db
+    from app.model.models import Task, User, Job
+
+    for client in clients:
+        user = User.query.filter_by(login=client.login).first()
+        client.task_ids = [task_id for task_id, in Task.query.filter_by(user_id=user.id)
+                           .with_entities(Task.id).order_by(Task.id)]
+        client.sent = 0
+        if scenario == 'delete_user':
+            client.spare_logins = [f'drop{client.number}_{i}' for i in range(requests)]
+            seed_users_fast(client.spare_logins)
+        if scenario == 'get_job':
+            client.job_id = uuid4().hex
+            db.session.add(Job(id=client.job_id, user_id=user.id, kind='import', status='done',
+                               result=json.dumps({'created': 100, 'errors': [], 'failed': 0}),
+                               finished=datetime.utcnow()))
+            db.session.commit()
+    db.session.remove()
+
+
+def drive(client: Client, scenario: str, requests: int) -> (list, int):
+    """Sends the requests of one client, returns latencies of successful requests and the number of errors"""
+
+    latencies = []
+    errors = 0
+    for _ in range(requests):
+        method, url, body, authorization = SCENARIOS[scenario](client)
+        headers = {'Content-Type': CONTENT_TYPES.get(scenario, 'application/json')} if body is not None else {}
+        if authorization:
+            headers.update(basic_auth(authorization, PASSWORD) if isinstance(authorization, str) else client.auth)
+        start = perf_counter()
+        status = client.transport.request(method, url, headers, body)
+        elapsed = perf_counter() - start
+        client.sent += 1
+        if status < 400:
+            latencies.append(elapsed)
+        else:
+            errors += 1
+    return latencies, errors
+
+
+def run(app, clients: list, scenario: str, requests: int) -> dict:
+    prepare(app, clients, scenario, requests)
+    start = perf_counter()
+    with ThreadPoolExecutor(len(clients)) as executor:
+        results = list(executor.map(lambda client: drive(client, scenario, requests), clients))
+    elapsed = perf_counter() - start
+    latencies = [latency for result in results for latency in result[0]]
+    result = {'requests': len(clients) * requests, 'errors': sum(result[1] for result in results),
+              'rps': round(len(clients) * requests / elapsed, 1)}
+    for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+        result[name] = round(percentile(latencies, fraction) * 1000, 3) if latencies else None
+    return result
+
+
+def start_server(app) -> (object, str):
+    """Starts a threaded local server on a free port"""
+
+    import logging
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # Без строки лога на каждый запрос
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(results: dict, baseline: dict = None):
+    columns = ('requests', 'errors', 'rps', 'p50', 'p95', 'p99')
+    print(f'{"scenario":<18}' + ''.join(f'{column:>10}' for column in columns)
+          + (f'{"rps diff":>10}' if baseline else ''))
+    for scenario, result in results.items():
+        line = f'{scenario:<18}' + ''.join(f'{str(result[column]):>10}' for column in columns)
+        old = (baseline or {}).get(scenario)
+        if old and old['rps']:
+            line += f'{(result["rps"] / old["rps"] - 1) * 100:>+9.1f}%'
+        print(line)
+    print('latencies in ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=8, help='seeded users, one per client')
+    parser.add_argument('--tasks', type=int, default=1000, help='tasks per user')
+    parser.add_argument('--requests', type=int, default=50, help='requests per client and scenario')
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS),
+                        help='scenario to run, can be repeated, all by default')
+    parser.add_argument('--server', action='store_true', help='send requests over HTTP to a local server')
+    parser.add_argument('--rate-limits', action='store_true', help='apply RATE_LIMITS if it is set, ignored by default')
+    parser.add_argument('--output', help='file for the results, benchmarks/results/<commit>.json by default')
+    parser.add_argument('--compare', help='results of an earlier run to compare with')
+    args = parser.parse_args()
+
+    path = use_temp_database()
+    from app import app, db, rate_limiter
+
+    if not args.rate_limits:
+        rate_limiter.limits = {}
+    server = None
+    try:
+        db.create_all()
+        logins = seed(args.users, args.tasks)
+        if args.server:
+            server, base_url = start_server(app)
+            transports = [HTTPClient(base_url) for _ in logins]
+        else:
+            transports = [TestClient(app) for _ in logins]
+        clients = [Client(transport, i, login) for i, (transport, login) in enumerate(zip(transports, logins))]
+
+        results = {}
+        for scenario in args.scenario or SCENARIOS:
+            results[scenario] = run(app, clients, scenario, args.requests)
+
+        commit = git_commit()
+        baseline = None
+        if args.compare:
+            with open(args.compare) as file:
+                baseline = json.load(file)['results']
+        report(results, baseline)
+
+        output = args.output or os.path.join(os.path.dirname(__file__), 'results', f'{commit or "results"}.json')
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as file:
+            json.dump({'commit': commit, 'date': datetime.now().isoformat(timespec='seconds'),
+                       'settings': {'users': args.users, 'tasks': args.tasks, 'requests': args.requests,
+                                    'server': args.server},
+                       'results': results}, file, indent=2)
+        print(f'results saved to {output}')
+    finally:
+        if server is not None:
+            server.shutdown()
+        db.session.remove()
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
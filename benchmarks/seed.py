@@ -0,0 +1,48 @@
+"""Seeding of a benchmark dataset through the services layer
+"""
+from werkzeug.security import generate_password_hash
+
+PASSWORD = 'pass'
+TASK = {'title': 'task', 'description': 'description', 'deadline': '2020-03-13 10:00'}
+
+
+def seed(users: int, tasks: int, prefix: str = 'user') -> list:
+    """Creates users with tasks
+
+    :param users: number of users
+    :param tasks: number of tasks of every user
+    :param prefix: prefix of the logins
+    :return: logins of the created users, all with the password PASSWORD
+
+    """
+
+    from app import app
+    import app.model.services as service
+
+    logins = []
+    for i in range(users):
+        login = f'{prefix}{i}'
+        code, message, user = service.create_user(login, PASSWORD)
+        assert code == 0, message
+        for start in range(0, tasks, app.config['BULK_TASKS_LIMIT']):
+            count = min(app.config['BULK_TASKS_LIMIT'], tasks - start)
+            code, message, _, _ = service.create_tasks([dict(TASK, title=f'task {start + j}') for j in range(count)],
+                                                       user)
+            assert code == 0, message
+        logins.append(login)
+    return logins
+
+
+def seed_users_fast(logins: list):
+    """Creates users without tasks sharing one password hash, skips hashing for every user
+
+    :param logins: logins of the users, all get the password PASSWORD
+
+    """
+
+    from app import db
+    from app.model.models import User
+
+    password_hash = generate_password_hash(PASSWORD)
+    db.session.bulk_insert_mappings(User, [{'login': login, 'password_hash': password_hash} for login in logins])
+    db.session.commit()
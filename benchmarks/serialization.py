@@ -0,0 +1,57 @@
+"""Serializing the task list: ORM objects + Task.to_dict + jsonify against rows + serializers
+"""
+import argparse
+import os
+from time import perf_counter
+
+from benchmarks.common import use_temp_database
+
+
+def best_of(repeat: int, function) -> float:
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tasks', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    path = use_temp_database()
+    from flask import jsonify
+    from app import app, db
+    import app.model.services as service
+    import app.model.serializers as serializers
+
+    try:
+        db.create_all()
+        _, _, user = service.create_user('bench', 'pass')
+        task = {'title': 'task', 'description': 'description', 'deadline': '2020-03-13 10:00'}
+        service.create_tasks([task] * args.tasks, user)
+
+        def orm():
+            tasks = service.get_tasks(service.check_login('bench'))
+            jsonify({'tasks': [task.to_dict() for task in tasks]}).get_data()
+            db.session.remove()
+
+        def rows():
+            rows = service.get_task_rows(service.check_login('bench'))
+            serializers.dumps({'tasks': [serializers.task_row_to_dict(row) for row in rows]})
+            db.session.remove()
+
+        db.session.remove()
+        with app.app_context():
+            print(f'{args.tasks} tasks, best of {args.repeat}, JSON backend {serializers.backend}')
+            print(f'objects + to_dict + jsonify: {best_of(args.repeat, orm) * 1000:8.1f} ms')
+            print(f'rows + serializers:          {best_of(args.repeat, rows) * 1000:8.1f} ms')
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
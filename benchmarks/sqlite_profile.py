@@ -0,0 +1,86 @@
+"""Throughput of concurrent writer/reader processes with the default and sqlite-wal storage profiles
+"""
+import argparse
+import multiprocessing
+import os
+from time import perf_counter
+
+from benchmarks.common import use_temp_database
+
+
+def worker(profile: str, database: str, login: str, seconds: float, write_ratio: float, seed: int) -> dict:
+    """Mixes task reads and writes of one user for the given time, runs in its own process"""
+
+    os.environ['STORAGE_PROFILE'] = profile
+    os.environ['DATABASE_URL'] = database
+    import random
+    from sqlalchemy.exc import OperationalError
+    from app import db
+    import app.model.services as service
+
+    random.seed(seed)
+    task = {'title': 'task', 'description': 'description', 'deadline': '2020-03-13 10:00'}
+    stats = {'reads': 0, 'writes': 0, 'errors': 0}
+    finish = perf_counter() + seconds
+    while perf_counter() < finish:
+        try:
+            user = service.check_login(login)
+            if random.random() < write_ratio:
+                if service.create_task(dict(task), user)[0] == 0:
+                    stats['writes'] += 1
+                else:
+                    stats['errors'] += 1
+            else:
+                service.get_tasks(user, limit=50)
+                stats['reads'] += 1
+        except OperationalError:  # database is locked
+            db.session.rollback()
+            stats['errors'] += 1
+        db.session.remove()
+    return stats
+
+
+def create_schema(database: str, users: int):
+    os.environ['DATABASE_URL'] = database
+    from app import db
+    import app.model.services as service
+
+    db.create_all()
+    for i in range(users):
+        service.create_user(f'user{i}', 'pass')
+
+
+def run(profile: str, args) -> dict:
+    path = use_temp_database()
+    database = os.environ['DATABASE_URL']
+    try:
+        setup = multiprocessing.get_context('spawn').Process(target=create_schema, args=(database, args.processes))
+        setup.start()
+        setup.join()
+        with multiprocessing.get_context('spawn').Pool(args.processes) as pool:
+            results = pool.starmap(worker, [(profile, database, f'user{i}', args.seconds, args.write_ratio, i)
+                                            for i in range(args.processes)])
+        return {key: sum(result[key] for result in results) for key in results[0]}
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(f'{args.processes} processes, {args.seconds} s, {args.write_ratio:.0%} writes')
+    print(f'{"profile":12} {"reads/s":>10} {"writes/s":>10} {"errors":>8}')
+    for profile in ('default', 'sqlite-wal'):
+        stats = run(profile, args)
+        print(f'{profile:12} {stats["reads"] / args.seconds:10.1f} {stats["writes"] / args.seconds:10.1f} '
+              f'{stats["errors"]:8}')
+
+
+if __name__ == '__main__':
+    main()
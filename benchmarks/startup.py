@@ -0,0 +1,79 @@
+"""Cold start time of the app and the slowest imports
+
+Every run starts a new interpreter that imports the app and calls create_app, as a fresh
+web worker does. With --cli the run looks like the flask command line, which also loads
+Flask-Migrate and alembic. The import-time report of the last run is printed with
+the imports taking the most cumulative time.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+from benchmarks.common import use_temp_database, percentile
+
+CHILD = 'import time; start = time.perf_counter(); from app import create_app; create_app(); ' \
+        'print(time.perf_counter() - start)'
+
+
+def start(cli: bool) -> (float, str):
+    """Starts the app in a new interpreter
+
+    :return: (seconds, report): time of the import and create_app, output of -X importtime
+
+    """
+
+    env = dict(os.environ)
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    if cli:
+        env['FLASK_RUN_FROM_CLI'] = 'true'  # Так flask выставляет для своих команд
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD], env=env,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def slowest_imports(report: str, count: int, depth: int) -> list:
+    """Parses a report of -X importtime
+
+    :param report: output of -X importtime
+    :param count: number of imports to return
+    :param depth: maximum nesting of the imports, 1 - imported by the app itself
+    :return: list of (cumulative microseconds, module) sorted by time
+
+    """
+
+    imports = []
+    for line in report.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if (len(name) - len(name.lstrip())) // 2 <= depth:
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--cli', action='store_true', help='start like the flask command line')
+    parser.add_argument('--top', type=int, default=15, help='number of imports in the report')
+    parser.add_argument('--depth', type=int, default=1, help='maximum nesting of the imports in the report')
+    args = parser.parse_args()
+
+    path = use_temp_database()
+    try:
+        times, report = [], ''
+        for _ in range(args.runs):
+            seconds, report = start(args.cli)
+            times.append(seconds)
+        print(f'start {"like flask cli " if args.cli else ""}over {args.runs} runs: '
+              f'median {percentile(times, 0.5) * 1000:.1f} ms, min {min(times) * 1000:.1f} ms')
+        print(f'{"cumulative, ms":>15}  module')
+        for cumulative, name in slowest_imports(report, args.top, args.depth):
+            print(f'{cumulative / 1000:>15.1f}  {name}')
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Latency of per-user task queries before and after the composite indexes on Task
+"""
+import argparse
+import os
+import random
+import sqlite3
+from datetime import datetime, timedelta
+from time import perf_counter
+
+from benchmarks.common import use_temp_database
+
+
+def seed(path: str, users: int, tasks: int):
+    """Inserts users and tasks with plain sqlite3, much faster than through the ORM"""
+
+    connection = sqlite3.connect(path)
+    start = datetime(2020, 1, 1)
+    with connection:
+        connection.executemany('INSERT INTO user (id, login, password_hash) VALUES (?, ?, ?)',
+                               ((i, f'user{i}', '') for i in range(1, users + 1)))
+        connection.executemany(
+            'INSERT INTO task (title, description, deadline, done, user_id) VALUES (?, ?, ?, ?, ?)',
+            ((f'task {i}', 'description', str(start + timedelta(minutes=random.randrange(525600))),
+              random.random() < 0.5, random.randint(1, users)) for i in range(tasks)))
+    connection.close()
+
+
+def measure(users: int, repeat: int) -> dict:
+    from app import db
+    from app.model.models import Task, User
+    import app.model.services as service
+
+    logins = [f'user{random.randint(1, users)}' for _ in range(repeat)]
+    queries = {
+        'get_tasks(limit=50)': lambda user: service.get_tasks(user, limit=50),
+        'get_tasks(done, deadline)': lambda user: service.get_tasks(user, done=False,
+                                                                    deadline_to=datetime(2020, 2, 1)),
+        'get_task(id)': lambda user: service.get_task(user, user.id),
+        'tasks of user (delete_user)': lambda user: Task.query.filter_by(user_id=user.id).count(),
+    }
+    results = {}
+    for name, query in queries.items():
+        elapsed = 0.0
+        for login in logins:
+            user = User.query.filter_by(login=login).first()
+            start = perf_counter()
+            query(user)
+            elapsed += perf_counter() - start
+        db.session.remove()
+        results[name] = elapsed / repeat * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--tasks', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+
+    path = use_temp_database()
+    from app import db
+
+    try:
+        db.create_all()
+        indexes = db.Model.metadata.tables['task'].indexes  # Все индексы Task, в том числе добавленные позже
+        for index in indexes:
+            index.drop(db.engine)
+        seed(path, args.users, args.tasks)
+        before = measure(args.users, args.repeat)
+        for index in indexes:
+            index.create(db.engine)
+        db.engine.execute('ANALYZE')
+        after = measure(args.users, args.repeat)
+
+        print(f'{args.users} users, {args.tasks} tasks, mean latency in ms')
+        print(f'{"query":30} {"before":>10} {"after":>10}')
+        for name in before:
+            print(f'{name:30} {before[name]:10.3f} {after[name]:10.3f}')
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
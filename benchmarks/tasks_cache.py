@@ -0,0 +1,76 @@
+"""Latency of polling-heavy traffic on GET /tasks with and without the task list cache
+"""
+import argparse
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from json import dumps
+from time import perf_counter
+
+from benchmarks.common import use_temp_database, basic_auth, percentile
+
+
+def poll(app, users: int, requests: int, write_ratio: float) -> list:
+    """Sends requests of one client: mostly GET /tasks, sometimes a new task"""
+
+    client = app.test_client()
+    task = {'title': 'task', 'description': 'description', 'deadline': '2020-03-13 10:00'}
+    latencies = []
+    for _ in range(requests):
+        headers = basic_auth(f'user{random.randrange(users)}', 'pass')
+        if random.random() < write_ratio:
+            client.post('/create_task', headers=headers, data=dumps(task), content_type='application/json')
+            continue
+        start = perf_counter()
+        response = client.get('/tasks', headers=headers)
+        latencies.append(perf_counter() - start)
+        assert response.status_code == 200, response.data
+    return latencies
+
+
+def run(app, args) -> list:
+    with ThreadPoolExecutor(args.clients) as executor:
+        futures = [executor.submit(poll, app, args.users, args.requests, args.write_ratio)
+                   for _ in range(args.clients)]
+        return [latency for future in futures for latency in future.result()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--tasks', type=int, default=500, help='tasks per user')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='requests per client')
+    parser.add_argument('--write-ratio', type=float, default=0.02)
+    args = parser.parse_args()
+
+    path = use_temp_database()
+    from app import app, db, tasks_cache
+    import app.model.services as service
+
+    try:
+        db.create_all()
+        task = {'title': 'task', 'description': 'description', 'deadline': '2020-03-13 10:00'}
+        for i in range(args.users):
+            _, _, user = service.create_user(f'user{i}', 'pass')
+            service.create_tasks([task] * args.tasks, user)
+        db.session.remove()
+
+        size = tasks_cache.backend.size
+        tasks_cache.backend.size = 0
+        without_cache = run(app, args)
+        tasks_cache.backend.size = size
+        tasks_cache.clear()
+        with_cache = run(app, args)
+
+        print(f'{args.clients} clients, {args.users} users x {args.tasks} tasks, latency of GET /tasks in ms')
+        print(f'{"":16} {"p50":>8} {"p95":>8} {"p99":>8}')
+        for name, latencies in (('without cache', without_cache), ('with cache', with_cache)):
+            print(f'{name:16} ' + ' '.join(f'{percentile(latencies, p) * 1000:8.2f}' for p in (0.5, 0.95, 0.99)))
+        print(f'hit rate {tasks_cache.hit_rate:.1%}')
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
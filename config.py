@@ -6,4 +6,73 @@ class Config(object):
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'test-list-tasks'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'app.db')
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Реплика базы только для чтения (не задана - все запросы к основной базе); после своих изменений
+    # пользователь REPLICA_READ_AFTER_WRITE секунд читает из основной базы
+    REPLICA_DATABASE_URI = os.environ.get('REPLICA_DATABASE_URL')
+    REPLICA_READ_AFTER_WRITE = float(os.environ.get('REPLICA_READ_AFTER_WRITE') or 5)
+    # Профиль хранилища (app/model/storage.py): default или sqlite-wal для нескольких воркеров
+    STORAGE_PROFILE = os.environ.get('STORAGE_PROFILE') or 'default'
+    # Кэш проверенных паролей HTTP Basic (0 - отключен)
+    AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE') or 1024)
+    AUTH_CACHE_TTL = int(os.environ.get('AUTH_CACHE_TTL') or 300)
+    # Кэш сериализованных списков задач: в памяти процесса (TASKS_CACHE_SIZE записей, 0 - отключен,
+    # и не больше TASKS_CACHE_BYTES байт, ответ больше этого не кэшируется)
+    # или на Redis-совместимом сервере, если задан TASKS_CACHE_URL (нужен пакет redis)
+    TASKS_CACHE_SIZE = int(os.environ.get('TASKS_CACHE_SIZE') or 1024)
+    TASKS_CACHE_BYTES = int(os.environ.get('TASKS_CACHE_BYTES') or 64 * 1024 * 1024)
+    TASKS_CACHE_URL = os.environ.get('TASKS_CACHE_URL')
+    TASKS_CACHE_TTL = int(os.environ.get('TASKS_CACHE_TTL') or 300)
+    # Лента изменений /tasks/changes: максимальное ожидание, период опроса базы и размер ответа
+    CHANGES_WAIT = float(os.environ.get('CHANGES_WAIT') or 25)
+    CHANGES_POLL_INTERVAL = float(os.environ.get('CHANGES_POLL_INTERVAL') or 1)
+    CHANGES_LIMIT = int(os.environ.get('CHANGES_LIMIT') or 1000)
+    # На сервере WSGI ожидающий запрос /tasks/changes занимает поток: число таких запросов процесса,
+    # остальные получают 503 с Retry-After (в режиме ASGI ожидание идет в цикле событий без ограничения)
+    CHANGES_MAX_WAITERS = int(os.environ.get('CHANGES_MAX_WAITERS') or 32)
+    # Ограничение частоты запросов пользователя (token bucket): "метод=запросов в секунду/запас",
+    # * - остальные методы, по умолчанию лимитов нет; счетчики в памяти процесса или на Redis-совместимом
+    # сервере RATE_LIMIT_URL
+    RATE_LIMITS = os.environ.get('RATE_LIMITS') or ''
+    RATE_LIMIT_URL = os.environ.get('RATE_LIMIT_URL')
+    # Период /tasks/upcoming по умолчанию; размер пакета и период (сек) сканирования наступивших
+    # сроков командой flask notify-due
+    UPCOMING_WITHIN = os.environ.get('UPCOMING_WITHIN') or '24h'
+    DUE_BATCH_SIZE = int(os.environ.get('DUE_BATCH_SIZE') or 1000)
+    DUE_INTERVAL = float(os.environ.get('DUE_INTERVAL') or 60)
+    # События ленты изменений старше EVENTS_RETENTION дней удаляет flask notify-due (0 - хранятся всегда)
+    EVENTS_RETENTION = float(os.environ.get('EVENTS_RETENTION') or 7)
+    # Число потоков, выполняющих запросы в режиме ASGI (app/asgi.py), и длина очереди запросов,
+    # ожидающих свободный поток; запросы сверх очереди получают 503
+    ASGI_THREADS = int(os.environ.get('ASGI_THREADS') or 64)
+    ASGI_QUEUE = int(os.environ.get('ASGI_QUEUE') or 256)
+    # Сжатие ответов gzip/brotli: минимальный размер ответа в байтах и уровень сжатия
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE') or 1024)
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL') or 6)
+    # Профилирование cProfile медленных запросов: порог в мс (0 - отключено), доля профилируемых
+    # запросов и каталог для файлов .prof
+    PROFILE_SLOW_REQUESTS = float(os.environ.get('PROFILE_SLOW_REQUESTS') or 0)
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE') or 0.01)
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or os.path.join(basedir, 'profiles')
+    # Время жизни токена доступа в секундах
+    TOKEN_EXPIRATION = int(os.environ.get('TOKEN_EXPIRATION') or 3600)
+    # Максимальный размер страницы списка задач
+    TASKS_PAGE_LIMIT = int(os.environ.get('TASKS_PAGE_LIMIT') or 1000)
+    # Число строк, загружаемых за раз при потоковой выдаче списка задач
+    STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE') or 500)
+    # Максимальное число задач в одном запросе /create_tasks
+    BULK_TASKS_LIMIT = int(os.environ.get('BULK_TASKS_LIMIT') or 10000)
+    # Пользователь с большим числом задач удаляется в фоне
+    DELETE_USER_ASYNC_THRESHOLD = int(os.environ.get('DELETE_USER_ASYNC_THRESHOLD') or 10000)
+    # Запрос /create_tasks с большим числом задач выполняется в фоне
+    BULK_TASKS_ASYNC_THRESHOLD = int(os.environ.get('BULK_TASKS_ASYNC_THRESHOLD') or 1000)
+    # Загрузка задач /import: задач в одной транзакции, максимум ошибок в ответе и размер файла
+    # в байтах, начиная с которого он загружается фоновым заданием
+    IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE') or 5000)
+    IMPORT_ERRORS_LIMIT = int(os.environ.get('IMPORT_ERRORS_LIMIT') or 100)
+    IMPORT_ASYNC_SIZE = int(os.environ.get('IMPORT_ASYNC_SIZE') or 10 * 1024 * 1024)
+    # Число потоков, выполняющих фоновые задания (/jobs/<id>)
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS') or 2)
+    # Задания в статусе queued или running старше JOB_TIMEOUT секунд считаются потерянными при
+    # перезапуске процесса: flask notify-due доводит до конца delete_user, остальные отмечает failed
+    JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT') or 3600)